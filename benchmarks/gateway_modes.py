@@ -0,0 +1,148 @@
+"""
+Нагрузочное сравнение режимов API Gateway: sync (Flask) и async (aiohttp)
+
+Поднимает заглушку Course Service с задержкой ответа, запускает gateway в
+каждом режиме отдельным процессом и отправляет GET /api/courses с заданной
+конкурентностью. Печатает пропускную способность и перцентили задержки.
+
+Использование:
+    python benchmarks/gateway_modes.py --concurrency 500 --requests 5000 --delay 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+GATEWAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'api_gateway')
+
+
+def free_port():
+    """Свободный TCP порт на localhost"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def start_upstream(port, delay):
+    """Заглушка Course Service: отвечает на /courses после задержки"""
+    async def courses(request):
+        await asyncio.sleep(delay)
+        return web.json_response([{'id': i, 'title': f'Course {i}'} for i in range(20)])
+
+    app = web.Application()
+    app.router.add_get('/courses', courses)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port, backlog=4096).start()
+    return runner
+
+
+def start_gateway(mode, port, upstream_port):
+    """Запустить gateway (python app.py) в указанном режиме"""
+    env = dict(os.environ)
+    env.update({
+        'GATEWAY_MODE': mode,
+        'PORT': str(port),
+        'COURSE_SERVICE_URL': f'http://127.0.0.1:{upstream_port}',
+    })
+    return subprocess.Popen(
+        [sys.executable, 'app.py'], cwd=GATEWAY_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+
+
+async def wait_ready(port, timeout=20):
+    """Дождаться ответа /health от gateway"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f'http://127.0.0.1:{port}/health') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f'gateway on port {port} did not start')
+
+
+async def run_load(port, concurrency, total):
+    """Отправить total запросов, держа concurrency запросов в полете"""
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    async with session.get(f'http://127.0.0.1:{port}/api/courses') as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    return {
+        'rps': total / elapsed,
+        'p50': percentile(0.50),
+        'p99': percentile(0.99),
+        'errors': errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--delay', type=float, default=0.05, help='задержка ответа upstream, с')
+    parser.add_argument('--modes', default='sync,async')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = await start_upstream(upstream_port, args.delay)
+
+    print(f"concurrency={args.concurrency} requests={args.requests} upstream_delay={args.delay * 1000:.0f}ms")
+    print(f"{'mode':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    try:
+        for mode in args.modes.split(','):
+            port = free_port()
+            gateway = start_gateway(mode, port, upstream_port)
+            try:
+                await wait_ready(port)
+                result = await run_load(port, args.concurrency, args.requests)
+                print(f"{mode:<8}{result['rps']:>10.0f}{result['p50']:>10.1f}{result['p99']:>10.1f}{result['errors']:>8}")
+            finally:
+                os.killpg(gateway.pid, signal.SIGTERM)
+                gateway.wait()
+    finally:
+        await upstream.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
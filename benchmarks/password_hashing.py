@@ -0,0 +1,83 @@
+"""
+Стоимость параметров KDF паролей Auth Service на текущем железе
+
+Для каждого кандидата PASSWORD_HASH_METHOD (формат Werkzeug) измеряет
+время одного хеширования в одном процессе (проверка пароля при входе
+стоит столько же) и пропускную способность пула из --processes процессов,
+как в password_hasher.py. Печатает задержку (p50, p95), входов в секунду
+на ядро и на пул. Цель - выбрать самые дорогие параметры, при которых
+вход укладывается в бюджет задержки и ожидаемый пик входов.
+
+Использование:
+    python benchmarks/password_hashing.py --methods pbkdf2:sha256:600000,scrypt:32768:8:1 --rounds 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'auth_service'))
+from password_hasher import DEFAULT_METHOD, normalize_method  # noqa: E402
+
+DEFAULT_CANDIDATES = ','.join([
+    'pbkdf2:sha256:260000', DEFAULT_METHOD, 'pbkdf2:sha256:1000000',
+    'scrypt:16384:8:1', 'scrypt:32768:8:1', 'scrypt:65536:8:1',
+])
+PASSWORD = 'correct horse battery staple'
+
+
+def verify_rounds(password_hash, rounds):
+    """rounds проверок пароля подряд (работа одного процесса пула)"""
+    for _ in range(rounds):
+        check_password_hash(password_hash, PASSWORD)
+    return rounds
+
+
+def measure(method, rounds, processes):
+    """Задержка одной проверки и пропускная способность пула"""
+    password_hash = generate_password_hash(PASSWORD, method=method)
+    latencies = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        check_password_hash(password_hash, PASSWORD)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # Прогрев: процессы пула запускаются до замера
+        list(pool.map(verify_rounds, [password_hash] * processes, [1] * processes))
+        started = time.perf_counter()
+        total = sum(pool.map(verify_rounds, [password_hash] * processes, [rounds] * processes))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000,
+        'per_core': 1 / statistics.median(latencies),
+        'pool': total / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--methods', default=DEFAULT_CANDIDATES, help='кандидаты через запятую')
+    parser.add_argument('--rounds', type=int, default=10, help='проверок на кандидата (и на процесс пула)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='процессов в пуле')
+    args = parser.parse_args()
+
+    print(f"rounds={args.rounds} processes={args.processes} cpus={os.cpu_count()}")
+    print(f"{'method':<26}{'p50 ms':>10}{'p95 ms':>10}{'logins/s/core':>15}{'logins/s pool':>15}")
+    for method in args.methods.split(','):
+        method = normalize_method(method.strip())
+        result = measure(method, args.rounds, args.processes)
+        print(f"{method:<26}{result['p50']:>10.1f}{result['p95']:>10.1f}"
+              f"{result['per_core']:>15.1f}{result['pool']:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
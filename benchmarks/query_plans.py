@@ -0,0 +1,138 @@
+"""
+Планы и время горячих запросов Course/Learning Service до и после миграций с индексами
+
+Создает временные SQLite базы Course и Learning Service со схемой в том
+виде, в каком ее создавал db.create_all() до появления индексов, заполняет
+их данными, выполняет горячие запросы (EXPLAIN QUERY PLAN + среднее время), затем применяет
+миграцию с индексами из services/*/migrations.py и повторяет замеры.
+
+Использование:
+    python benchmarks/query_plans.py --courses 2000 --lessons 20 --students 5000
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services')
+
+# Схема до миграции 1 (только первичные ключи и ограничения уникальности);
+# у каждого сервиса своя база
+BASELINE_SCHEMA = {
+    'course_service': [
+        'CREATE TABLE course (id INTEGER PRIMARY KEY, title VARCHAR(200) NOT NULL, description TEXT, '
+        'creator_id INTEGER NOT NULL, created_at DATETIME, is_published BOOLEAN, banner_image TEXT)',
+    ],
+    'learning_service': [
+        'CREATE TABLE lesson (id INTEGER PRIMARY KEY, course_id INTEGER NOT NULL, title VARCHAR(200) NOT NULL, '
+        'content TEXT, images TEXT, "order" INTEGER, created_at DATETIME)',
+        'CREATE TABLE enrollment (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, course_id INTEGER NOT NULL, '
+        'enrolled_at DATETIME, progress INTEGER, CONSTRAINT unique_enrollment UNIQUE (user_id, course_id))',
+        'CREATE TABLE lesson_progress (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, lesson_id INTEGER NOT NULL, '
+        'completed_at DATETIME, CONSTRAINT unique_lesson_progress UNIQUE (user_id, lesson_id))',
+    ],
+}
+
+# (сервис, название, SQL, параметры)
+QUERIES = [
+    ('course_service', 'catalog page', 'SELECT id, title FROM course WHERE is_published = 1 AND id > :after ORDER BY id LIMIT 51', {'after': 1000}),
+    ('course_service', 'courses by creator', 'SELECT id, title FROM course WHERE creator_id = :creator_id', {'creator_id': 7}),
+    ('learning_service', 'lessons of course', 'SELECT id, title FROM lesson WHERE course_id = :course_id ORDER BY "order"', {'course_id': 500}),
+    ('learning_service', 'lesson count', 'SELECT count(*) FROM lesson WHERE course_id = :course_id', {'course_id': 500}),
+    ('learning_service', 'enrollments of course', 'SELECT id, user_id FROM enrollment WHERE course_id = :course_id', {'course_id': 500}),
+    ('learning_service', 'progress of lesson', 'SELECT count(*) FROM lesson_progress WHERE lesson_id = :lesson_id', {'lesson_id': 5000}),
+]
+
+
+def index_migrations(service):
+    """Миграция с индексами (версия 1) из migrations.py сервиса"""
+    service_dir = os.path.join(SERVICES_DIR, service)
+    sys.path.insert(0, service_dir)  # migrations.py импортирует соседние модули сервиса
+    try:
+        spec = importlib.util.spec_from_file_location(f'{service}_migrations', os.path.join(service_dir, 'migrations.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(service_dir)
+    return module.run_migrations, [migration for migration in module.MIGRATIONS if migration[0] == 1]
+
+
+def populate(engines, courses, lessons_per_course, students):
+    """Заполнить базы сервисов синтетическими данными"""
+    rng = random.Random(42)
+    for service, engine in engines.items():
+        with engine.begin() as connection:
+            for statement in BASELINE_SCHEMA[service]:
+                connection.execute(text(statement))
+
+    with engines['course_service'].begin() as connection:
+        connection.execute(text(
+            'INSERT INTO course (id, title, creator_id, is_published) VALUES (:id, :title, :creator_id, :is_published)'
+        ), [{'id': i, 'title': f'Course {i}', 'creator_id': i % 200, 'is_published': i % 10 != 0} for i in range(1, courses + 1)])
+
+    with engines['learning_service'].begin() as connection:
+        connection.execute(text(
+            'INSERT INTO lesson (course_id, title, content, "order") VALUES (:course_id, :title, :content, :order)'
+        ), [{'course_id': c, 'title': f'Lesson {n}', 'content': 'x' * 200, 'order': n}
+            for c in range(1, courses + 1) for n in range(lessons_per_course)])
+        enrollments = {(rng.randint(1, students), rng.randint(1, courses)) for _ in range(students * 5)}
+        connection.execute(text(
+            'INSERT INTO enrollment (user_id, course_id, progress) VALUES (:user_id, :course_id, 0)'
+        ), [{'user_id': u, 'course_id': c} for u, c in enrollments])
+        total_lessons = courses * lessons_per_course
+        progress = {(rng.randint(1, students), rng.randint(1, total_lessons)) for _ in range(students * 20)}
+        connection.execute(text(
+            'INSERT INTO lesson_progress (user_id, lesson_id) VALUES (:user_id, :lesson_id)'
+        ), [{'user_id': u, 'lesson_id': l} for u, l in progress])
+
+
+def measure(engines, repeat):
+    """План и среднее время каждого запроса"""
+    results = {}
+    for service, name, sql, params in QUERIES:
+        with engines[service].connect() as connection:
+            plan = ' / '.join(row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params))
+            started = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(text(sql), params).fetchall()
+            results[name] = (plan, (time.perf_counter() - started) / repeat * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--lessons', type=int, default=20, help='уроков на курс')
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engines = {
+            service: create_engine(f"sqlite:///{os.path.join(tmp, service + '.db')}")
+            for service in BASELINE_SCHEMA
+        }
+        populate(engines, args.courses, args.lessons, args.students)
+
+        before = measure(engines, args.repeat)
+        for service, engine in engines.items():
+            run_migrations, migrations = index_migrations(service)
+            run_migrations(engine, migrations)
+        after = measure(engines, args.repeat)
+
+    print(f"courses={args.courses} lessons={args.courses * args.lessons} students={args.students}")
+    print(f"{'query':<24}{'before ms':>11}{'after ms':>10}  plan before -> after")
+    for _, name, _, _ in QUERIES:
+        plan_before, ms_before = before[name]
+        plan_after, ms_after = after[name]
+        print(f"{name:<24}{ms_before:>11.3f}{ms_after:>10.3f}  {plan_before} -> {plan_after}")
+
+
+if __name__ == '__main__':
+    main()
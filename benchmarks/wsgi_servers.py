@@ -0,0 +1,146 @@
+"""
+Нагрузочное сравнение серверов Learning Service: Flask dev server и gunicorn
+
+Создает временную SQLite базу с уроками курса, запускает сервис отдельным
+процессом в каждом режиме (python app.py с debug=True, как раньше, и
+gunicorn -c gunicorn.conf.py, как в образе) и отправляет GET
+/courses/<id>/lessons?view=summary с заданной конкурентностью. Печатает
+пропускную способность и перцентили задержки.
+
+Использование:
+    python benchmarks/wsgi_servers.py --concurrency 50 --requests 5000 --workers 4 --threads 4
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'learning_service')
+COURSE_ID = 1
+
+
+def free_port():
+    """Свободный TCP порт на localhost"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def prepare_db(tmp, lessons):
+    """База сервиса со схемой из init_db() и уроками одного курса"""
+    path = os.path.join(tmp, 'learning.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', BLOB_STORE_DIR=os.path.join(tmp, 'blobs'))
+    subprocess.run([sys.executable, '-c', 'from app import init_db; init_db()'], cwd=SERVICE_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    with sqlite3.connect(path) as connection:
+        connection.executemany(
+            'INSERT INTO lesson (course_id, title, content, "order", created_at) VALUES (?, ?, ?, ?, ?)',
+            [(COURSE_ID, f'Lesson {n}', 'x' * 2000, n, '2024-01-01 00:00:00') for n in range(lessons)]
+        )
+    return env
+
+
+def start_server(mode, port, env, workers, threads):
+    """Запустить сервис: dev - python app.py, gunicorn - как в Docker образе"""
+    env = dict(env, PORT=str(port), GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads))
+    command = [sys.executable, 'app.py'] if mode == 'dev' else [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py']
+    return subprocess.Popen(
+        command, cwd=SERVICE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+
+
+async def wait_ready(port, timeout=30):
+    """Дождаться ответа /health от сервиса"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f'http://127.0.0.1:{port}/health') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f'service on port {port} did not start')
+
+
+async def run_load(port, concurrency, total):
+    """Отправить total запросов, держа concurrency запросов в полете"""
+    latencies = []
+    errors = 0
+    remaining = total
+    url = f'http://127.0.0.1:{port}/courses/{COURSE_ID}/lessons?view=summary'
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def worker():
+            nonlocal errors, remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    async with session.get(url) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    return {
+        'rps': total / elapsed,
+        'p50': percentile(0.50),
+        'p99': percentile(0.99),
+        'errors': errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--lessons', type=int, default=50, help='уроков в курсе')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--modes', default='dev,gunicorn')
+    args = parser.parse_args()
+
+    print(f"concurrency={args.concurrency} requests={args.requests} lessons={args.lessons} "
+          f"cpus={os.cpu_count()} gunicorn workers={args.workers} threads={args.threads}")
+    print(f"{'mode':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        env = prepare_db(tmp, args.lessons)
+        for mode in args.modes.split(','):
+            port = free_port()
+            server = start_server(mode, port, env, args.workers, args.threads)
+            try:
+                await wait_ready(port)
+                result = await run_load(port, args.concurrency, args.requests)
+                print(f"{mode:<10}{result['rps']:>10.0f}{result['p50']:>10.1f}{result['p99']:>10.1f}{result['errors']:>8}")
+            finally:
+                os.killpg(server.pid, signal.SIGTERM)
+                server.wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -2,41 +2,47 @@
 API Gateway - Микросервис маршрутизации запросов
 """
 
-from flask import Flask, request, jsonify, redirect
+from flask import Flask, Response, request, jsonify, redirect, stream_with_context
 from flask_cors import CORS
 import requests
 import os
 import time
 import socket
+from http_client import PooledHttpClient
+from metrics import init_metrics, observe_upstream
+from resilience import CircuitBreakerRegistry, RetryPolicy, FAILURE_STATUS_CODES
+from endpoint_resolver import EndpointResolver
+from response_cache import (
+    BufferedResponse, ResponseCache, accepted_encoding, cache_tags, purge_tags, etag_matches, not_modified_headers, without_length
+)
+from urllib3.exceptions import NewConnectionError
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
 
-# URL микросервисов
-# В Docker Swarm можно использовать короткие имена (auth-service) или полные (learning-platform_auth-service)
-STACK_NAME = os.environ.get('STACK_NAME', 'learning-platform')
+# Пул keep-alive соединений к backend сервисам (переиспользуется между запросами)
+http_client = PooledHttpClient.from_env()
 
-def get_service_url(env_var, default_host, default_port, service_name):
-    """Получить URL сервиса с поддержкой альтернативных имен в Swarm"""
-    url = os.environ.get(env_var, f'http://{default_host}:{default_port}')
-    
-    # В Swarm используем полные имена по умолчанию, но также поддерживаем короткие
-    # Если используется короткое имя сервиса, создаем альтернативное полное имя
-    if f'://{service_name}:' in url:
-        # Создаем альтернативное полное имя для Swarm
-        alt_url = url.replace(f'://{service_name}:', f'://{STACK_NAME}_{service_name}:')
-        # В Swarm пробуем сначала полное имя, потом короткое
-        return alt_url, url
-    elif f'://{STACK_NAME}_{service_name}:' in url:
-        # Уже используется полное имя, создаем короткое как альтернативу
-        short_url = url.replace(f'://{STACK_NAME}_{service_name}:', f'://{service_name}:')
-        return url, short_url
-    
-    return url, None
+# Метрики Prometheus (GET /metrics): маршруты gateway и время ответа каждого сервиса
+init_metrics(app)
+http_client.observer = observe_upstream
+
+# Circuit breaker на каждый upstream и политика повторов
+breakers = CircuitBreakerRegistry.from_env()
+retry_policy = RetryPolicy.from_env()
+
+# URL микросервисов и таблица маршрутов общие для синхронного и асинхронного режимов
+from gateway_routes import (
+    STACK_NAME, AUTH_SERVICE, AUTH_SERVICE_ALT, COURSE_SERVICE, COURSE_SERVICE_ALT,
+    LEARNING_SERVICE, LEARNING_SERVICE_ALT, ROUTES, SERVICE_CANDIDATES, STREAMING_PROXY, STREAM_CHUNK_SIZE,
+    CACHED_ROUTES, CACHE_PURGES, get_urls_to_try, route_target, passthrough_headers, conditional_headers, is_error_page
+)
+
+# Кэш ответов публичных GET маршрутов (каталог курсов, списки уроков)
+response_cache = ResponseCache.from_env()
 
-AUTH_SERVICE, AUTH_SERVICE_ALT = get_service_url('AUTH_SERVICE_URL', 'localhost', '5001', 'auth-service')
-COURSE_SERVICE, COURSE_SERVICE_ALT = get_service_url('COURSE_SERVICE_URL', 'localhost', '5002', 'course-service')
-LEARNING_SERVICE, LEARNING_SERVICE_ALT = get_service_url('LEARNING_SERVICE_URL', 'localhost', '5003', 'learning-service')
+# Запоминает, какой из адресов сервиса (полное/короткое имя в Swarm) реально работает
+endpoint_resolver = EndpointResolver.from_env(SERVICE_CANDIDATES)
 
 # Логирование конфигурации
 print(f"API Gateway Configuration:")
@@ -65,10 +71,11 @@ print(f"LEARNING_SERVICE: {LEARNING_SERVICE}")
 
 # Проверка доступности сервисов при старте (с задержкой для Swarm)
 def wait_for_services():
-    """Ожидание доступности сервисов"""
+    """Ожидание доступности сервисов и запуск фоновой перепроверки их адресов"""
     max_wait = 60  # максимум 60 секунд
     wait_time = 0
     interval = 2
+    ready = False
     
     services = [
         ('auth-service', AUTH_SERVICE),
@@ -87,211 +94,270 @@ def wait_for_services():
         
         if all_ready:
             print("All services are resolvable!")
-            return True
+            ready = True
+            break
         
         time.sleep(interval)
         wait_time += interval
     
-    print("Warning: Some services may not be resolvable yet, but continuing...")
-    return False
+    if not ready:
+        print("Warning: Some services may not be resolvable yet, but continuing...")
+    
+    # Результат не выбрасываем: резолвер проверяет всех кандидатов, запоминает рабочие
+    # адреса и перепроверяет их в фоне
+    endpoint_resolver.start()
+    return ready
 
 # Запуск проверки в фоновом режиме
 import threading
 threading.Thread(target=wait_for_services, daemon=True).start()
 
 
-def proxy_request(service_url, path, method='GET', data=None, headers=None, retries=3, alt_url=None):
-    """Проксирование запроса к микросервису с повторными попытками и fallback на альтернативный URL"""
+def stream_response(response):
+    """Передать ответ сервиса клиенту потоком: статус, заголовки и тело без разбора"""
+    if is_error_page(response.status_code, response.headers.get('Content-Type')):
+        response.close()
+        return {'error': 'Некорректный ответ от сервиса', 'status_code': response.status_code}, response.status_code
+    
+    def generate():
+        try:
+            # decode_content=False: gzip и прочие Content-Encoding уходят клиенту как есть
+            for chunk in response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False):
+                yield chunk
+        finally:
+            response.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        status=response.status_code,
+        headers=passthrough_headers(response.headers),
+        direct_passthrough=True
+    )
+
+
+def buffered_response(result):
+    """Ответ сервиса, прочитанный целиком (некэшируемый статус), в том же виде, что и потоковый"""
+    if is_error_page(result.status_code, result.headers.get('Content-Type')):
+        return jsonify({'error': 'Некорректный ответ от сервиса', 'status_code': result.status_code}), result.status_code
+    return Response(result.body, status=result.status_code, headers=without_length(passthrough_headers(result.headers)))
+
+
+def cached_response(entry, from_cache):
+    """Ответ из записи кэша: 304 по совпавшему If-None-Match или полное тело"""
+    not_modified = etag_matches(request.headers.get('If-None-Match'), entry.etag)
+    if from_cache:
+        response_cache.record_served(entry, not_modified)
+    if not_modified:
+        return Response(status=304, headers=not_modified_headers(entry.headers))
+    return Response(entry.body, status=entry.status, headers=entry.headers)
+
+
+def is_connect_error(error):
+    """Соединение с сервисом не было установлено, значит запрос точно не обработан"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+def upstream_error(error, base_url, urls_to_try):
+    """Ответ gateway на сбой связи с сервисом"""
+    if isinstance(error, requests.exceptions.ConnectionError) and not isinstance(error, requests.exceptions.ConnectTimeout):
+        return jsonify({'error': f'Не удалось подключиться к сервису. Попробованы: {", ".join(urls_to_try)}. Ошибка: {str(error)}. Проверьте, что сервис запущен и доступен.'}), 503
+    if isinstance(error, requests.exceptions.Timeout):
+        return jsonify({'error': f'Таймаут при подключении к сервису {base_url}'}), 504
+    return jsonify({'error': f'Ошибка связи с сервисом {base_url}: {str(error)}'}), 503
+
+
+def circuit_open_error(urls_to_try):
+    """Ответ gateway, когда все адреса сервиса отключены circuit breaker'ом"""
+    retry_after = min(breakers.get(base_url).retry_after() for base_url in urls_to_try)
+    response = jsonify({'error': 'Сервис временно недоступен, повторите запрос позже'})
+    response.headers['Retry-After'] = str(max(int(retry_after + 0.999), 1))
+    return response, 503
+
+
+def proxy_request(service_url, path, method='GET', data=None, headers=None, retries=None, alt_url=None, raw_body=None,
+                  buffered=False):
+    """Проксирование запроса к микросервису с повторными попытками и fallback на альтернативный URL
+
+    buffered=True - вернуть (статус, заголовки, тело как есть) для кэширования вместо ответа клиенту.
+    """
     # В Swarm полные имена имеют приоритет, поэтому если есть альтернативный URL (который может быть полным),
     # пробуем его первым
-    urls_to_try = []
-    if alt_url and 'learning-platform_' in alt_url:
-        # Если альтернативный URL содержит полное имя, пробуем его первым
-        urls_to_try = [alt_url, service_url]
-    else:
-        urls_to_try = [service_url]
-        if alt_url:
-            urls_to_try.append(alt_url)
+    urls_to_try = endpoint_resolver.order(get_urls_to_try(service_url, alt_url))
+    retries = retries or retry_policy.max_attempts
     
     # Подготовка headers
     request_headers = {'Content-Type': 'application/json'}
     if headers:
         request_headers.update(headers)
     
-    last_error = None
+    # Тело запроса клиента передается как есть, без повторной сериализации JSON
+    body_kwargs = {'data': raw_body} if raw_body is not None else {'json': data}
+    
+    stream = STREAMING_PROXY or buffered
+    failure = None
     
-    # Пробуем каждый URL
+    # Пробуем каждый URL, пропуская те, для которых открыт circuit breaker
     for base_url in urls_to_try:
+        breaker = breakers.get(base_url)
         url = f"{base_url}{path}"
         
         # Повторные попытки для каждого URL
         for attempt in range(retries):
+            if not breaker.allow_request():
+                break
             try:
                 if method == 'GET':
-                    response = requests.get(url, headers=request_headers, timeout=10)
+                    response = http_client.get(url, headers=request_headers, timeout=10, stream=stream)
                 elif method == 'POST':
-                    response = requests.post(url, json=data, headers=request_headers, timeout=10)
+                    response = http_client.post(url, headers=request_headers, timeout=10, stream=stream, **body_kwargs)
                 elif method == 'PUT':
-                    response = requests.put(url, json=data, headers=request_headers, timeout=10)
+                    response = http_client.put(url, headers=request_headers, timeout=10, stream=stream, **body_kwargs)
                 elif method == 'DELETE':
-                    response = requests.delete(url, headers=request_headers, timeout=10)
+                    response = http_client.delete(url, headers=request_headers, timeout=10, stream=stream)
                 else:
                     return jsonify({'error': 'Метод не поддерживается'}), 405
-                
-                # Обработка ответа
-                try:
-                    response_data = response.json()
-                except ValueError:
-                    response_data = {'error': 'Некорректный ответ от сервиса', 'status_code': response.status_code}
-                
-                return response_data, response.status_code
-                
-            except requests.exceptions.ConnectionError as e:
-                last_error = e
-                if attempt < retries - 1:
-                    time.sleep(1)  # Задержка перед повторной попыткой
-                    continue
-                # Если это последняя попытка для этого URL, пробуем следующий URL
-                if base_url == urls_to_try[-1] and attempt == retries - 1:
-                    # Это последний URL и последняя попытка
-                    return jsonify({'error': f'Не удалось подключиться к сервису. Попробованы: {", ".join(urls_to_try)}. Ошибка: {str(e)}. Проверьте, что сервис запущен и доступен.'}), 503
-                break  # Переходим к следующему URL
-            except requests.exceptions.Timeout as e:
-                last_error = e
-                if attempt < retries - 1:
-                    time.sleep(1)
-                    continue
-                if base_url == urls_to_try[-1] and attempt == retries - 1:
-                    return jsonify({'error': f'Таймаут при подключении к сервису {base_url}'}), 504
-                break
             except requests.exceptions.RequestException as e:
-                last_error = e
+                breaker.record_failure()
+                endpoint_resolver.record_failure(base_url)
+                failure = upstream_error(e, base_url, urls_to_try)
+                if not retry_policy.is_safe_to_retry(method, is_connect_error(e)):
+                    # Запрос мог быть обработан: ни повторять, ни слать на другой URL нельзя
+                    return failure
                 if attempt < retries - 1:
-                    time.sleep(1)
+                    time.sleep(retry_policy.backoff(attempt))  # Экспоненциальная задержка с jitter
                     continue
-                if base_url == urls_to_try[-1] and attempt == retries - 1:
-                    return jsonify({'error': f'Ошибка связи с сервисом {base_url}: {str(e)}'}), 503
-                break
+                break  # Переходим к следующему URL
+            
+            if response.status_code in FAILURE_STATUS_CODES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+                endpoint_resolver.record_success(urls_to_try, base_url)
+            
+            if buffered:
+                try:
+                    body = response.raw.read(decode_content=False)
+                except Exception as e:
+                    return upstream_error(e, base_url, urls_to_try)
+                finally:
+                    response.close()
+                return BufferedResponse(response.status_code, response.headers, body)
+            
+            if STREAMING_PROXY:
+                return stream_response(response)
+            
+            # Обработка ответа
+            try:
+                response_data = response.json()
+            except ValueError:
+                response_data = {'error': 'Некорректный ответ от сервиса', 'status_code': response.status_code}
+            
+            return response_data, response.status_code
     
-    # Если все попытки исчерпаны
-    return jsonify({'error': f'Не удалось подключиться к сервису после {retries} попыток для каждого URL. Последняя ошибка: {str(last_error)}'}), 503
-
-
-@app.route('/health', methods=['GET'])
-def health():
-    """Проверка здоровья gateway"""
-    return jsonify({'status': 'healthy', 'service': 'api-gateway'}), 200
-
-
-# Маршруты для Auth Service
-@app.route('/api/auth/register', methods=['POST'])
-def register():
-    return proxy_request(AUTH_SERVICE, '/register', 'POST', request.json)
-
-
-@app.route('/api/auth/login', methods=['POST'])
-def login():
-    return proxy_request(AUTH_SERVICE, '/login', 'POST', request.json, alt_url=AUTH_SERVICE_ALT)
-
-
-@app.route('/api/auth/validate', methods=['POST'])
-def validate():
-    return proxy_request(AUTH_SERVICE, '/validate', 'POST', request.json, alt_url=AUTH_SERVICE_ALT)
-
-
-@app.route('/api/auth/user/<int:user_id>', methods=['GET'])
-def get_user(user_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(AUTH_SERVICE, f'/user/{user_id}', 'GET', headers=headers, alt_url=AUTH_SERVICE_ALT)
-
-
-# Маршруты для Course Service
-@app.route('/api/courses', methods=['GET'])
-def get_courses():
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(COURSE_SERVICE, '/courses', 'GET', headers=headers, alt_url=COURSE_SERVICE_ALT)
-
-
-@app.route('/api/courses/my', methods=['GET'])
-def get_my_courses():
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(COURSE_SERVICE, '/courses/my', 'GET', headers=headers, alt_url=COURSE_SERVICE_ALT)
-
-
-@app.route('/api/courses', methods=['POST'])
-def create_course():
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(COURSE_SERVICE, '/courses', 'POST', request.json, headers=headers, alt_url=COURSE_SERVICE_ALT)
-
-
-@app.route('/api/courses/<int:course_id>', methods=['GET'])
-def get_course(course_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(COURSE_SERVICE, f'/courses/{course_id}', 'GET', headers=headers, alt_url=COURSE_SERVICE_ALT)
+    # Все попытки исчерпаны или все адреса отключены circuit breaker'ом
+    return failure or circuit_open_error(urls_to_try)
 
 
-@app.route('/api/courses/<int:course_id>', methods=['PUT'])
-def update_course(course_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(COURSE_SERVICE, f'/courses/{course_id}', 'PUT', request.json, headers=headers, alt_url=COURSE_SERVICE_ALT)
+@app.route('/endpoints', methods=['GET'])
+def endpoints():
+    """Выбранные рабочие адреса backend сервисов"""
+    return jsonify(endpoint_resolver.snapshot()), 200
 
 
-@app.route('/api/courses/<int:course_id>', methods=['DELETE'])
-def delete_course(course_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(COURSE_SERVICE, f'/courses/{course_id}', 'DELETE', headers=headers, alt_url=COURSE_SERVICE_ALT)
+@app.route('/circuit-breakers', methods=['GET'])
+def circuit_breakers():
+    """Состояние circuit breaker'ов по каждому upstream"""
+    return jsonify(breakers.snapshot()), 200
 
 
-# Маршруты для Learning Service
-@app.route('/api/courses/<int:course_id>/lessons', methods=['GET'])
-def get_lessons(course_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(LEARNING_SERVICE, f'/courses/{course_id}/lessons', 'GET', headers=headers, alt_url=LEARNING_SERVICE_ALT)
-
-
-@app.route('/api/courses/<int:course_id>/lessons', methods=['POST'])
-def create_lesson(course_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(LEARNING_SERVICE, f'/courses/{course_id}/lessons', 'POST', request.json, headers=headers, alt_url=LEARNING_SERVICE_ALT)
-
-
-@app.route('/api/lessons/<int:lesson_id>', methods=['GET'])
-def get_lesson(lesson_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(LEARNING_SERVICE, f'/lessons/{lesson_id}', 'GET', headers=headers, alt_url=LEARNING_SERVICE_ALT)
-
-
-@app.route('/api/lessons/<int:lesson_id>', methods=['PUT'])
-def update_lesson(lesson_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(LEARNING_SERVICE, f'/lessons/{lesson_id}', 'PUT', request.json, headers=headers, alt_url=LEARNING_SERVICE_ALT)
-
-
-@app.route('/api/lessons/<int:lesson_id>', methods=['DELETE'])
-def delete_lesson(lesson_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(LEARNING_SERVICE, f'/lessons/{lesson_id}', 'DELETE', headers=headers, alt_url=LEARNING_SERVICE_ALT)
-
-
-@app.route('/api/courses/<int:course_id>/enroll', methods=['POST'])
-def enroll_course(course_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(LEARNING_SERVICE, f'/courses/{course_id}/enroll', 'POST', headers=headers, alt_url=LEARNING_SERVICE_ALT)
-
-
-@app.route('/api/users/<int:user_id>/enrollments', methods=['GET'])
-def get_user_enrollments(user_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(LEARNING_SERVICE, f'/users/{user_id}/enrollments', 'GET', headers=headers, alt_url=LEARNING_SERVICE_ALT)
+@app.route('/health', methods=['GET'])
+def health():
+    """Проверка здоровья gateway"""
+    return jsonify({'status': 'healthy', 'service': 'api-gateway'}), 200
 
 
-@app.route('/api/lessons/<int:lesson_id>/complete', methods=['POST'])
-def complete_lesson(lesson_id):
-    headers = {'Authorization': request.headers.get('Authorization', '')}
-    return proxy_request(LEARNING_SERVICE, f'/lessons/{lesson_id}/complete', 'POST', headers=headers, alt_url=LEARNING_SERVICE_ALT)
+@app.route('/response-cache/stats', methods=['GET'])
+def response_cache_stats():
+    """Статистика кэша ответов публичных GET маршрутов"""
+    return jsonify(response_cache.stats()), 200
+
+
+@app.route('/http-pool/stats', methods=['GET'])
+def http_pool_stats():
+    """Статистика пулов соединений к backend сервисам"""
+    return jsonify(http_client.stats()), 200
+
+
+def forward(route, service_url, alt_url, path, headers):
+    """Передать запрос клиента сервису без кэширования"""
+    if STREAMING_PROXY:
+        # Клиент сам решает, принимать ли сжатый ответ: gateway его не распаковывает
+        headers['Accept-Encoding'] = request.headers.get('Accept-Encoding', 'identity')
+        headers.update(conditional_headers(request.headers))
+        raw_body = None
+        if route.body:
+            raw_body = request.get_data()
+            if 'Content-Type' in request.headers:
+                headers['Content-Type'] = request.headers['Content-Type']
+        return proxy_request(service_url, path, route.method, headers=headers, alt_url=alt_url, raw_body=raw_body)
+    data = request.get_json(silent=True) if route.body else None
+    return proxy_request(service_url, path, route.method, data, headers=headers, alt_url=alt_url)
+
+
+def cached_proxy(route, view_args, service_url, alt_url, path, headers):
+    """GET публичного маршрута через кэш ответов gateway"""
+    encoding = accepted_encoding(request.headers.get('Accept-Encoding'))
+    key = (route.endpoint, path, encoding)
+    entry = response_cache.get(key)
+    if entry is not None:
+        return cached_response(entry, True)
+    
+    # Поколение до запроса: сброс во время запроса к сервису не даст сохранить старый ответ
+    tags = cache_tags(route.endpoint, view_args)
+    generation = response_cache.generation(tags)
+    # Условные заголовки клиента сервису не передаются: для кэша нужно полное тело
+    headers['Accept-Encoding'] = encoding
+    result = proxy_request(service_url, path, route.method, headers=headers, alt_url=alt_url, buffered=True)
+    if not isinstance(result, BufferedResponse):
+        return result
+    if result.status_code != 200:
+        return buffered_response(result)
+    entry = response_cache.put(key, result.status_code, passthrough_headers(result.headers), result.body,
+                               tags, generation)
+    return cached_response(entry, False)
+
+
+def make_proxy_view(route):
+    """Создать view, проксирующий маршрут из таблицы ROUTES"""
+    def view(**view_args):
+        service_url, alt_url, path = route_target(route, view_args, request.query_string.decode('latin-1'))
+        headers = {'Authorization': request.headers.get('Authorization', '')} if route.auth else {}
+        if route.endpoint in CACHED_ROUTES and response_cache.enabled:
+            return cached_proxy(route, view_args, service_url, alt_url, path, headers)
+        response = forward(route, service_url, alt_url, path, headers)
+        if route.endpoint in CACHE_PURGES:
+            # Данные изменены (или могли измениться): сбрасываем закэшированные списки
+            response_cache.purge(purge_tags(CACHE_PURGES[route.endpoint], view_args))
+        return response
+    view.__name__ = route.endpoint
+    return view
+
+
+# Маршруты ко всем backend сервисам (см. gateway_routes.ROUTES)
+for route in ROUTES:
+    app.add_url_rule(route.rule, route.endpoint, make_proxy_view(route), methods=[route.method])
 
 
 if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # GATEWAY_MODE=async - асинхронный gateway на aiohttp с той же таблицей маршрутов
+    if os.environ.get('GATEWAY_MODE', 'sync').lower() == 'async':
+        from async_app import main
+        main()
+    else:
+        port = int(os.environ.get('PORT', 5000))
+        app.run(host='0.0.0.0', port=port, debug=True)
 
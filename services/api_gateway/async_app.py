@@ -0,0 +1,407 @@
+"""
+API Gateway - асинхронный режим (aiohttp)
+
+Проксирует ту же таблицу маршрутов /api/*, что и Flask версия (gateway_routes.ROUTES),
+но ожидание ответа backend сервиса не занимает поток: один процесс держит
+тысячи одновременных запросов. Включается переменной GATEWAY_MODE=async.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+
+import aiohttp
+from aiohttp import web
+
+from gateway_routes import (
+    ROUTES, SERVICE_CANDIDATES, STREAMING_PROXY, STREAM_CHUNK_SIZE, CACHED_ROUTES, CACHE_PURGES, get_urls_to_try,
+    route_target, passthrough_headers, conditional_headers, is_error_page
+)
+from resilience import CircuitBreakerRegistry, RetryPolicy, FAILURE_STATUS_CODES
+from endpoint_resolver import EndpointResolver
+from prometheus_client import CONTENT_TYPE_LATEST
+from metrics import REQUEST_LATENCY, REQUESTS_IN_PROGRESS, metrics_payload, observe_upstream
+from response_cache import (
+    BufferedResponse, ResponseCache, accepted_encoding, cache_tags, purge_tags, etag_matches, not_modified_headers, without_length
+)
+
+# Ограничения пула соединений к backend сервисам (0 - без ограничения)
+ASYNC_LIMIT = int(os.environ.get('GATEWAY_ASYNC_LIMIT', 1000))
+ASYNC_LIMIT_PER_HOST = int(os.environ.get('GATEWAY_ASYNC_LIMIT_PER_HOST', 0))
+UPSTREAM_TIMEOUT = float(os.environ.get('GATEWAY_UPSTREAM_TIMEOUT', 10))
+
+CORS_ALLOW_METHODS = 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+client_stats = {'requests': 0, 'errors': 0, 'connections_opened': 0, 'connections_reused': 0}
+
+# Circuit breaker на каждый upstream и политика повторов
+breakers = CircuitBreakerRegistry.from_env()
+retry_policy = RetryPolicy.from_env()
+
+# Кэш ответов публичных GET маршрутов (каталог курсов, списки уроков)
+response_cache = ResponseCache.from_env()
+
+# Запоминает, какой из адресов сервиса (полное/короткое имя в Swarm) реально работает
+endpoint_resolver = EndpointResolver.from_env(SERVICE_CANDIDATES)
+
+
+def error_response(message, status):
+    """JSON ответ с ошибкой в формате Flask версии"""
+    return web.json_response({'error': message}, status=status)
+
+
+async def stream_response(client_request, response):
+    """Передать ответ сервиса клиенту потоком: статус, заголовки и тело без разбора"""
+    if is_error_page(response.status, response.headers.get('Content-Type')):
+        return web.json_response({'error': 'Некорректный ответ от сервиса', 'status_code': response.status},
+                                 status=response.status)
+
+    stream = web.StreamResponse(status=response.status, headers=passthrough_headers(response.headers))
+    await stream.prepare(client_request)
+    # Сессия создана с auto_decompress=False: gzip уходит клиенту как есть
+    try:
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            await stream.write(chunk)
+        await stream.write_eof()
+    except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionResetError) as e:
+        # Заголовки уже отправлены: повторить запрос нельзя, обрываем ответ
+        print(f"Stream from upstream aborted: {e}")
+    return stream
+
+
+def buffered_response(result):
+    """Ответ сервиса, прочитанный целиком (некэшируемый статус), в том же виде, что и потоковый"""
+    if is_error_page(result.status_code, result.headers.get('Content-Type')):
+        return web.json_response({'error': 'Некорректный ответ от сервиса', 'status_code': result.status_code},
+                                 status=result.status_code)
+    return web.Response(body=result.body, status=result.status_code,
+                        headers=without_length(passthrough_headers(result.headers)))
+
+
+def cached_response(client_request, entry, from_cache):
+    """Ответ из записи кэша: 304 по совпавшему If-None-Match или полное тело"""
+    not_modified = etag_matches(client_request.headers.get('If-None-Match'), entry.etag)
+    if from_cache:
+        response_cache.record_served(entry, not_modified)
+    if not_modified:
+        return web.Response(status=304, headers=not_modified_headers(entry.headers))
+    return web.Response(body=entry.body, status=entry.status, headers=entry.headers)
+
+
+def upstream_error(error, base_url, urls_to_try):
+    """Ответ gateway на сбой связи с сервисом"""
+    if isinstance(error, asyncio.TimeoutError):
+        return error_response(f'Таймаут при подключении к сервису {base_url}', 504)
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return error_response(f'Не удалось подключиться к сервису. Попробованы: {", ".join(urls_to_try)}. Ошибка: {str(error)}. Проверьте, что сервис запущен и доступен.', 503)
+    return error_response(f'Ошибка связи с сервисом {base_url}: {str(error)}', 503)
+
+
+def circuit_open_error(urls_to_try):
+    """Ответ gateway, когда все адреса сервиса отключены circuit breaker'ом"""
+    retry_after = min(breakers.get(base_url).retry_after() for base_url in urls_to_try)
+    response = error_response('Сервис временно недоступен, повторите запрос позже', 503)
+    response.headers['Retry-After'] = str(max(int(retry_after + 0.999), 1))
+    return response
+
+
+async def proxy_request(session, service_url, path, method='GET', data=None, headers=None, retries=None, alt_url=None,
+                        raw_body=None, client_request=None, buffered=False):
+    """Асинхронное проксирование с теми же повторами, fallback и circuit breaker, что и в Flask версии
+
+    buffered=True - вернуть (статус, заголовки, тело как есть) для кэширования вместо ответа клиенту.
+    """
+    urls_to_try = endpoint_resolver.order(get_urls_to_try(service_url, alt_url))
+    retries = retries or retry_policy.max_attempts
+
+    request_headers = {'Content-Type': 'application/json'}
+    if headers:
+        request_headers.update(headers)
+
+    kwargs = {'headers': request_headers}
+    if method in ('POST', 'PUT'):
+        if raw_body is not None:
+            kwargs['data'] = raw_body
+        else:
+            kwargs['json'] = data
+
+    failure = None
+
+    for base_url in urls_to_try:
+        breaker = breakers.get(base_url)
+        url = f"{base_url}{path}"
+
+        for attempt in range(retries):
+            if not breaker.allow_request():
+                break
+            try:
+                response = await session.request(method, url, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                client_stats['errors'] += 1
+                breaker.record_failure()
+                endpoint_resolver.record_failure(base_url)
+                failure = upstream_error(e, base_url, urls_to_try)
+                connect_failed = isinstance(e, aiohttp.ClientConnectorError)
+                if not retry_policy.is_safe_to_retry(method, connect_failed):
+                    # Запрос мог быть обработан: ни повторять, ни слать на другой URL нельзя
+                    return failure
+                if attempt < retries - 1:
+                    await asyncio.sleep(retry_policy.backoff(attempt))  # Экспоненциальная задержка с jitter
+                    continue
+                break  # Переходим к следующему URL
+
+            if response.status in FAILURE_STATUS_CODES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+                endpoint_resolver.record_success(urls_to_try, base_url)
+
+            async with response:
+                if buffered:
+                    try:
+                        body = await response.read()
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        return upstream_error(e, base_url, urls_to_try)
+                    return BufferedResponse(response.status, response.headers, body)
+                if client_request is not None:
+                    return await stream_response(client_request, response)
+                try:
+                    body = await response.read()
+                    response_data = json.loads(body)
+                except (ValueError, aiohttp.ClientError, asyncio.TimeoutError):
+                    response_data = {'error': 'Некорректный ответ от сервиса', 'status_code': response.status}
+                return web.json_response(response_data, status=response.status)
+
+    # Все попытки исчерпаны или все адреса отключены circuit breaker'ом
+    return failure or circuit_open_error(urls_to_try)
+
+
+async def forward(request, route, service_url, alt_url, path, headers):
+    """Передать запрос клиента сервису без кэширования"""
+    if STREAMING_PROXY:
+        headers['Accept-Encoding'] = request.headers.get('Accept-Encoding', 'identity')
+        headers.update(conditional_headers(request.headers))
+        raw_body = None
+        if route.body:
+            raw_body = await request.read()
+            if 'Content-Type' in request.headers:
+                headers['Content-Type'] = request.headers['Content-Type']
+        return await proxy_request(request.app['client'], service_url, path, route.method,
+                                   headers=headers, alt_url=alt_url, raw_body=raw_body, client_request=request)
+
+    # Буферизованный режим: ответ разбирается, поэтому просим несжатое тело
+    headers['Accept-Encoding'] = 'identity'
+    data = None
+    if route.body and request.can_read_body:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+    return await proxy_request(request.app['client'], service_url, path, route.method, data,
+                               headers=headers, alt_url=alt_url)
+
+
+async def cached_proxy(request, route, view_args, service_url, alt_url, path, headers):
+    """GET публичного маршрута через кэш ответов gateway"""
+    encoding = accepted_encoding(request.headers.get('Accept-Encoding'))
+    key = (route.endpoint, path, encoding)
+    entry = response_cache.get(key)
+    if entry is not None:
+        return cached_response(request, entry, True)
+
+    # Поколение до запроса: сброс во время запроса к сервису не даст сохранить старый ответ
+    tags = cache_tags(route.endpoint, view_args)
+    generation = response_cache.generation(tags)
+    # Условные заголовки клиента сервису не передаются: для кэша нужно полное тело
+    headers['Accept-Encoding'] = encoding
+    result = await proxy_request(request.app['client'], service_url, path, route.method,
+                                 headers=headers, alt_url=alt_url, buffered=True)
+    if not isinstance(result, BufferedResponse):
+        return result
+    if result.status_code != 200:
+        return buffered_response(result)
+    entry = response_cache.put(key, result.status_code, passthrough_headers(result.headers), result.body,
+                               tags, generation)
+    return cached_response(request, entry, False)
+
+
+def make_handler(route):
+    """Создать обработчик для маршрута из таблицы ROUTES"""
+    async def handler(request):
+        view_args = dict(request.match_info)
+        service_url, alt_url, path = route_target(route, view_args, request.rel_url.raw_query_string)
+        headers = {'Authorization': request.headers.get('Authorization', '')} if route.auth else {}
+        if route.endpoint in CACHED_ROUTES and response_cache.enabled:
+            return await cached_proxy(request, route, view_args, service_url, alt_url, path, headers)
+        response = await forward(request, route, service_url, alt_url, path, headers)
+        if route.endpoint in CACHE_PURGES:
+            # Данные изменены (или могли измениться): сбрасываем закэшированные списки
+            response_cache.purge(purge_tags(CACHE_PURGES[route.endpoint], view_args))
+        return response
+    return handler
+
+
+def to_aiohttp_rule(rule):
+    """Перевести правило Flask (<int:id>, <string:name>) в формат aiohttp ({id:\\d+}, {name})"""
+    rule = re.sub(r'<string:(\w+)>', r'{\1}', rule)
+    return re.sub(r'<int:(\w+)>', r'{\1:\\d+}', rule)
+
+
+def route_label(request):
+    """Шаблон маршрута aiohttp (/api/lessons/{lesson_id}), а не фактический путь"""
+    route = request.match_info.route
+    return route.resource.canonical if route.resource is not None else 'unmatched'
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Задержка и число запросов в обработке по маршруту (как init_metrics во Flask версии)"""
+    route = route_label(request)
+    status = 500
+    started = time.perf_counter()
+    REQUESTS_IN_PROGRESS.labels(request.method, route).inc()
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        REQUESTS_IN_PROGRESS.labels(request.method, route).dec()
+        REQUEST_LATENCY.labels(request.method, route, str(status)).observe(time.perf_counter() - started)
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """CORS для /api/* (аналог Flask-CORS с origins='*' и supports_credentials)"""
+    if not request.path.startswith('/api/'):
+        return await handler(request)
+
+    preflight = request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers
+    response = web.Response(status=200) if preflight else await handler(request)
+
+    origin = request.headers.get('Origin')
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Vary'] = 'Origin'
+    if preflight:
+        response.headers['Access-Control-Allow-Methods'] = CORS_ALLOW_METHODS
+        requested_headers = request.headers.get('Access-Control-Request-Headers')
+        if requested_headers:
+            response.headers['Access-Control-Allow-Headers'] = requested_headers
+    return response
+
+
+async def health(request):
+    """Проверка здоровья gateway"""
+    return web.json_response({'status': 'healthy', 'service': 'api-gateway', 'mode': 'async'})
+
+
+async def http_pool_stats(request):
+    """Статистика пула соединений к backend сервисам"""
+    total = client_stats['requests']
+    return web.json_response({
+        'limit': ASYNC_LIMIT,
+        'limit_per_host': ASYNC_LIMIT_PER_HOST,
+        **client_stats,
+        'reuse_rate': round(client_stats['connections_reused'] / total, 4) if total else 0.0
+    })
+
+
+async def response_cache_stats(request):
+    """Статистика кэша ответов публичных GET маршрутов"""
+    return web.json_response(response_cache.stats())
+
+
+async def metrics(request):
+    """Метрики в текстовом формате Prometheus"""
+    return web.Response(body=metrics_payload(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+async def endpoints(request):
+    """Выбранные рабочие адреса backend сервисов"""
+    return web.json_response(endpoint_resolver.snapshot())
+
+
+async def circuit_breakers(request):
+    """Состояние circuit breaker'ов по каждому upstream"""
+    return web.json_response(breakers.snapshot())
+
+
+def make_trace_config():
+    """Счетчики запросов, переиспользования соединений и время ответа каждого сервиса"""
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        client_stats['requests'] += 1
+        ctx.started = time.perf_counter()
+
+    async def on_request_end(session, ctx, params):
+        observe_upstream(params.method, str(params.url.origin()), params.url.path, params.response.status,
+                         time.perf_counter() - ctx.started)
+
+    async def on_request_exception(session, ctx, params):
+        observe_upstream(params.method, str(params.url.origin()), params.url.path, 'error',
+                         time.perf_counter() - ctx.started)
+
+    async def on_connection_create_end(session, ctx, params):
+        client_stats['connections_opened'] += 1
+
+    async def on_connection_reuseconn(session, ctx, params):
+        client_stats['connections_reused'] += 1
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+async def start_client(app):
+    """Общий ClientSession с keep-alive пулом на весь процесс и фоновая проверка адресов"""
+    endpoint_resolver.start()
+    connector = aiohttp.TCPConnector(limit=ASYNC_LIMIT, limit_per_host=ASYNC_LIMIT_PER_HOST)
+    app['client'] = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=UPSTREAM_TIMEOUT, sock_read=UPSTREAM_TIMEOUT),
+        cookie_jar=aiohttp.DummyCookieJar(),
+        auto_decompress=False,
+        trace_configs=[make_trace_config()]
+    )
+
+
+async def close_client(app):
+    """Закрыть соединения пула при остановке"""
+    await app['client'].close()
+
+
+def create_app():
+    """Создать aiohttp приложение gateway"""
+    app = web.Application(middlewares=[metrics_middleware, cors_middleware])
+    app.on_startup.append(start_client)
+    app.on_cleanup.append(close_client)
+
+    app.router.add_get('/health', health)
+    app.router.add_get('/http-pool/stats', http_pool_stats)
+    app.router.add_get('/response-cache/stats', response_cache_stats)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/circuit-breakers', circuit_breakers)
+    app.router.add_get('/endpoints', endpoints)
+    for route in ROUTES:
+        app.router.add_route(route.method, to_aiohttp_rule(route.rule), make_handler(route), name=route.endpoint)
+    return app
+
+
+def main():
+    port = int(os.environ.get('PORT', 5000))
+    print(f"API Gateway (async mode) listening on port {port}")
+    web.run_app(create_app(), host='0.0.0.0', port=port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Кэш рабочих адресов backend сервисов для fallback основного/альтернативного URL
+
+get_service_url() дает до двух кандидатов на сервис (короткое и полное имя в
+Swarm). Резолвер запоминает, какой из них реально отвечает, держит выбор
+TTL секунд и перепроверяет кандидатов в фоне, чтобы запросы не тратили
+время на заведомо неработающий первый адрес.
+"""
+
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+
+class EndpointResolver:
+    """Предпочтительный адрес для каждого сервиса с TTL и фоновой перепроверкой"""
+
+    def __init__(self, services, ttl=60.0, probe_interval=15.0, probe_timeout=2.0):
+        # services: {имя: [кандидаты в порядке по умолчанию]}
+        self.services = services
+        self.ttl = ttl
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._preferred = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.probes = 0
+
+    @classmethod
+    def from_env(cls, services):
+        """Настройки из GATEWAY_ENDPOINT_TTL / GATEWAY_ENDPOINT_PROBE_INTERVAL"""
+        return cls(
+            services,
+            ttl=float(os.environ.get('GATEWAY_ENDPOINT_TTL', 60)),
+            probe_interval=float(os.environ.get('GATEWAY_ENDPOINT_PROBE_INTERVAL', 15)),
+            probe_timeout=float(os.environ.get('GATEWAY_ENDPOINT_PROBE_TIMEOUT', 2))
+        )
+
+    def order(self, urls_to_try):
+        """Поставить запомненный рабочий адрес первым"""
+        if len(urls_to_try) < 2:
+            return urls_to_try
+        with self._lock:
+            preferred = None
+            for url in urls_to_try:
+                entry = self._preferred.get(url)
+                if entry and entry[1] > time.monotonic():
+                    preferred = entry[0]
+                    break
+        if preferred in urls_to_try and preferred != urls_to_try[0]:
+            return [preferred] + [url for url in urls_to_try if url != preferred]
+        return urls_to_try
+
+    def record_success(self, urls_to_try, base_url):
+        """Запрос через base_url прошел: запомнить его для всех кандидатов сервиса"""
+        if len(urls_to_try) < 2:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for url in urls_to_try:
+                self._preferred[url] = (base_url, expires_at)
+
+    def forget(self, urls_to_try):
+        """Сбросить выбор для кандидатов сервиса (вернуться к порядку по умолчанию)"""
+        with self._lock:
+            for url in urls_to_try:
+                self._preferred.pop(url, None)
+
+    def record_failure(self, base_url):
+        """Адрес перестал отвечать: забыть его как предпочтительный"""
+        with self._lock:
+            for url, (preferred, _) in list(self._preferred.items()):
+                if preferred == base_url:
+                    del self._preferred[url]
+
+    def probe(self, base_url):
+        """Кандидат разрешается в DNS и отвечает на /health"""
+        self.probes += 1
+        try:
+            socket.getaddrinfo(urlsplit(base_url).hostname, None)
+            response = requests.get(f"{base_url}/health", timeout=self.probe_timeout)
+            return response.status_code == 200
+        except (socket.gaierror, requests.exceptions.RequestException):
+            return False
+
+    def probe_service(self, candidates):
+        """Проверить кандидатов сервиса по порядку и запомнить первый рабочий"""
+        if len(candidates) < 2:
+            return candidates[0]  # Выбирать не из чего
+        for base_url in candidates:
+            if self.probe(base_url):
+                self.record_success(candidates, base_url)
+                return base_url
+        self.forget(candidates)
+        return None
+
+    def probe_all(self):
+        """Проверить все сервисы; True, если у каждого есть рабочий адрес"""
+        return all([self.probe_service(candidates) is not None for candidates in self.services.values()])
+
+    def start(self):
+        """Запустить фоновую перепроверку адресов"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.probe_all()
+            time.sleep(self.probe_interval)
+
+    def snapshot(self):
+        """Текущий выбор адресов для диагностики"""
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for name, candidates in self.services.items():
+                entry = self._preferred.get(candidates[0])
+                result[name] = {
+                    'candidates': candidates,
+                    'preferred': entry[0] if entry and entry[1] > now else None,
+                    'expires_in': round(entry[1] - now, 1) if entry and entry[1] > now else 0
+                }
+        return {'services': result, 'ttl': self.ttl, 'probe_interval': self.probe_interval, 'probes': self.probes}
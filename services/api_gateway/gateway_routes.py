@@ -0,0 +1,158 @@
+"""
+Таблица маршрутов API Gateway, адреса backend сервисов и настройки проксирования
+
+Общая для синхронного (Flask) и асинхронного (aiohttp) режимов gateway,
+чтобы оба режима проксировали одинаковый набор /api/* маршрутов.
+"""
+
+import os
+from collections import namedtuple
+
+# URL микросервисов
+# В Docker Swarm можно использовать короткие имена (auth-service) или полные (learning-platform_auth-service)
+STACK_NAME = os.environ.get('STACK_NAME', 'learning-platform')
+
+
+def get_service_url(env_var, default_host, default_port, service_name):
+    """Получить URL сервиса с поддержкой альтернативных имен в Swarm"""
+    url = os.environ.get(env_var, f'http://{default_host}:{default_port}')
+
+    # В Swarm используем полные имена по умолчанию, но также поддерживаем короткие
+    # Если используется короткое имя сервиса, создаем альтернативное полное имя
+    if f'://{service_name}:' in url:
+        # Создаем альтернативное полное имя для Swarm
+        alt_url = url.replace(f'://{service_name}:', f'://{STACK_NAME}_{service_name}:')
+        # В Swarm пробуем сначала полное имя, потом короткое
+        return alt_url, url
+    elif f'://{STACK_NAME}_{service_name}:' in url:
+        # Уже используется полное имя, создаем короткое как альтернативу
+        short_url = url.replace(f'://{STACK_NAME}_{service_name}:', f'://{service_name}:')
+        return url, short_url
+
+    return url, None
+
+
+# Потоковое проксирование: тело ответа передается клиенту кусками как есть
+# (включая gzip), без json() и повторной сериализации в gateway
+STREAMING_PROXY = os.environ.get('GATEWAY_STREAMING', 'true').lower() in ('1', 'true', 'yes')
+STREAM_CHUNK_SIZE = int(os.environ.get('GATEWAY_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Заголовки соединения (RFC 7230) и те, что сервер gateway выставляет сам
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade', 'server', 'date'
+}
+
+
+# Заголовки условных и частичных запросов клиента (ETag/304, Range/206),
+# передаются сервису в потоковом режиме
+CONDITIONAL_REQUEST_HEADERS = ('If-None-Match', 'If-Modified-Since', 'Range', 'If-Range')
+
+
+def conditional_headers(headers):
+    """Условные/Range заголовки запроса клиента для передачи сервису"""
+    return {name: headers[name] for name in CONDITIONAL_REQUEST_HEADERS if name in headers}
+
+
+def passthrough_headers(headers):
+    """Заголовки ответа сервиса, которые можно передать клиенту без изменений"""
+    return [(name, value) for name, value in headers.items() if name.lower() not in HOP_BY_HOP_HEADERS]
+
+
+def is_error_page(status_code, content_type):
+    """HTML/текстовая страница ошибки сервиса (ее gateway оборачивает в JSON, как раньше)"""
+    return status_code >= 400 and 'json' not in (content_type or '')
+
+
+def get_urls_to_try(service_url, alt_url=None):
+    """Порядок перебора URL: полное имя в Swarm имеет приоритет"""
+    if alt_url and 'learning-platform_' in alt_url:
+        # Если альтернативный URL содержит полное имя, пробуем его первым
+        return [alt_url, service_url]
+    urls_to_try = [service_url]
+    if alt_url:
+        urls_to_try.append(alt_url)
+    return urls_to_try
+
+
+AUTH_SERVICE, AUTH_SERVICE_ALT = get_service_url('AUTH_SERVICE_URL', 'localhost', '5001', 'auth-service')
+COURSE_SERVICE, COURSE_SERVICE_ALT = get_service_url('COURSE_SERVICE_URL', 'localhost', '5002', 'course-service')
+LEARNING_SERVICE, LEARNING_SERVICE_ALT = get_service_url('LEARNING_SERVICE_URL', 'localhost', '5003', 'learning-service')
+
+SERVICES = {
+    'auth': (AUTH_SERVICE, AUTH_SERVICE_ALT),
+    'course': (COURSE_SERVICE, COURSE_SERVICE_ALT),
+    'learning': (LEARNING_SERVICE, LEARNING_SERVICE_ALT),
+}
+
+# Кандидаты адресов каждого сервиса в порядке по умолчанию (для EndpointResolver)
+SERVICE_CANDIDATES = {name: get_urls_to_try(url, alt_url) for name, (url, alt_url) in SERVICES.items()}
+
+# endpoint - имя view во Flask, rule - маршрут gateway, path - путь в сервисе,
+# body - передавать JSON тело, auth - передавать Authorization, alt - разрешить альтернативный URL
+Route = namedtuple('Route', ['endpoint', 'method', 'rule', 'service', 'path', 'body', 'auth', 'alt'])
+
+ROUTES = [
+    # Маршруты для Auth Service
+    Route('register', 'POST', '/api/auth/register', 'auth', '/register', True, False, False),
+    Route('login', 'POST', '/api/auth/login', 'auth', '/login', True, False, True),
+    Route('refresh', 'POST', '/api/auth/refresh', 'auth', '/refresh', True, False, True),
+    Route('logout', 'POST', '/api/auth/logout', 'auth', '/logout', True, False, True),
+    Route('validate', 'POST', '/api/auth/validate', 'auth', '/validate', True, False, True),
+    Route('revoke', 'POST', '/api/auth/revoke', 'auth', '/revoke', True, True, True),
+    Route('get_user', 'GET', '/api/auth/user/<int:user_id>', 'auth', '/user/{user_id}', False, True, True),
+    Route('import_users', 'POST', '/api/auth/users/import', 'auth', '/users/import', True, True, False),
+
+    # Маршруты для Course Service
+    Route('get_courses', 'GET', '/api/courses', 'course', '/courses', False, True, True),
+    Route('get_my_courses', 'GET', '/api/courses/my', 'course', '/courses/my', False, True, True),
+    Route('search_courses', 'GET', '/api/courses/search', 'course', '/courses/search', False, True, True),
+    Route('create_course', 'POST', '/api/courses', 'course', '/courses', True, True, True),
+    Route('get_course', 'GET', '/api/courses/<int:course_id>', 'course', '/courses/{course_id}', False, True, True),
+    Route('update_course', 'PUT', '/api/courses/<int:course_id>', 'course', '/courses/{course_id}', True, True, True),
+    Route('delete_course', 'DELETE', '/api/courses/<int:course_id>', 'course', '/courses/{course_id}', False, True, True),
+    Route('get_banner', 'GET', '/api/banners/<string:digest>', 'course', '/banners/{digest}', False, False, True),
+
+    # Маршруты для Learning Service
+    Route('get_lessons', 'GET', '/api/courses/<int:course_id>/lessons', 'learning', '/courses/{course_id}/lessons', False, True, True),
+    Route('create_lesson', 'POST', '/api/courses/<int:course_id>/lessons', 'learning', '/courses/{course_id}/lessons', True, True, True),
+    Route('search_lessons', 'GET', '/api/lessons/search', 'learning', '/lessons/search', False, True, True),
+    Route('get_lesson', 'GET', '/api/lessons/<int:lesson_id>', 'learning', '/lessons/{lesson_id}', False, True, True),
+    Route('update_lesson', 'PUT', '/api/lessons/<int:lesson_id>', 'learning', '/lessons/{lesson_id}', True, True, True),
+    Route('delete_lesson', 'DELETE', '/api/lessons/<int:lesson_id>', 'learning', '/lessons/{lesson_id}', False, True, True),
+    Route('enroll_course', 'POST', '/api/courses/<int:course_id>/enroll', 'learning', '/courses/{course_id}/enroll', False, True, True),
+    Route('get_course_enrollments', 'GET', '/api/courses/<int:course_id>/enrollments', 'learning', '/courses/{course_id}/enrollments', False, True, True),
+    Route('get_user_enrollments', 'GET', '/api/users/<int:user_id>/enrollments', 'learning', '/users/{user_id}/enrollments', False, True, True),
+    Route('complete_lesson', 'POST', '/api/lessons/<int:lesson_id>/complete', 'learning', '/lessons/{lesson_id}/complete', False, True, True),
+    Route('complete_lessons_batch', 'POST', '/api/progress/batch', 'learning', '/progress/batch', True, True, True),
+    Route('get_image', 'GET', '/api/images/<string:digest>', 'learning', '/images/{digest}', False, False, True),
+]
+
+
+# Публичные GET маршруты, ответы которых одинаковы для всех пользователей
+# и кэшируются в gateway (response_cache.py)
+CACHED_ROUTES = {'get_courses', 'get_lessons'}
+
+# Изменяющие маршруты и теги записей кэша, которые они сбрасывают
+# (шаблоны подставляются параметрами маршрута: get_lessons:{course_id})
+CACHE_PURGES = {
+    'create_course': ['get_courses'],
+    'update_course': ['get_courses'],
+    'delete_course': ['get_courses'],
+    'create_lesson': ['get_lessons:{course_id}'],
+    # Курс урока gateway не известен: сбрасываются списки уроков всех курсов
+    'update_lesson': ['get_lessons'],
+    'delete_lesson': ['get_lessons'],
+}
+
+
+def route_target(route, view_args, query_string=''):
+    """Адреса сервиса и путь запроса для маршрута с подставленными параметрами
+
+    Строка запроса клиента (fields, view, limit, after и т.п.) передается сервису без изменений.
+    """
+    service_url, alt_url = SERVICES[route.service]
+    path = route.path.format(**view_args)
+    if query_string:
+        path = f'{path}?{query_string}'
+    return service_url, (alt_url if route.alt else None), path
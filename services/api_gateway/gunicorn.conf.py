@@ -0,0 +1,53 @@
+"""
+Настройки gunicorn для продакшен запуска API Gateway
+
+GATEWAY_MODE=sync - Flask приложение app:app на потоковых воркерах (gthread),
+GATEWAY_MODE=async - aiohttp приложение async_app:create_app() на воркерах
+aiohttp.GunicornWebWorker. По умолчанию один воркер: кэш ответов, circuit
+breaker'ы и кэш рабочих адресов живут в памяти процесса, а сброс кэша при
+изменяющем запросе действует только в своем процессе. Поэтому при нескольких
+воркерах или репликах (GATEWAY_REPLICAS) TTL кэша ответов ограничивается
+GATEWAY_CACHE_SHARED_TTL, и остальные копии отдают старые данные не дольше
+него. Масштабирование - потоками (sync) или переходом в async режим.
+"""
+
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+if os.environ.get('GATEWAY_MODE', 'sync').lower() == 'async':
+    wsgi_app = 'async_app:create_app()'
+    worker_class = 'aiohttp.GunicornWebWorker'
+else:
+    wsgi_app = 'app:app'
+    worker_class = 'gthread' if threads > 1 else 'sync'
+# Ответ gateway ждет upstream до 10 с и повторы: запас сверху
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+
+# Метрики Prometheus со всех воркеров: prometheus_client пишет значения в файлы
+# этого каталога (multiprocess режим), GET /metrics любого воркера их суммирует
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus-metrics'))
+
+
+def reset_metrics_dir():
+    """Пустой каталог метрик при старте (значения прошлого запуска не учитываются)"""
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def on_starting(server):
+    reset_metrics_dir()
+
+
+def child_exit(server, worker):
+    """Значения gauge завершившегося воркера больше не учитываются"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
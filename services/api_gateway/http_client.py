@@ -0,0 +1,136 @@
+"""
+Пул keep-alive HTTP соединений для межсервисных запросов
+
+На каждый upstream (scheme://host:port) создается отдельная requests.Session
+со своим пулом соединений, поэтому TCP соединения переиспользуются между
+запросами вместо установки нового соединения на каждый вызов.
+"""
+
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def parse_pool_sizes(value):
+    """Разобрать HTTP_POOL_SIZES вида 'auth-service:5001=50,course-service:5002=20'"""
+    sizes = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        upstream, size = item.rsplit('=', 1)
+        try:
+            sizes[upstream.strip()] = int(size)
+        except ValueError:
+            print(f"Ignoring invalid pool size for {upstream.strip()}: {size}")
+    return sizes
+
+
+class PooledHttpClient:
+    """Клиент с пулом соединений на каждый upstream и метриками переиспользования"""
+
+    def __init__(self, pool_size=20, pool_sizes=None, pool_block=False):
+        self.pool_size = pool_size
+        self.pool_sizes = pool_sizes or {}
+        self.pool_block = pool_block
+        self._sessions = {}
+        self._requests = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        # observer(method, upstream, path, status, seconds) - учет вызовов в метриках
+        self.observer = None
+
+    @classmethod
+    def from_env(cls):
+        """Создать клиент по переменным окружения HTTP_POOL_SIZE / HTTP_POOL_SIZES"""
+        return cls(
+            pool_size=int(os.environ.get('HTTP_POOL_SIZE', 20)),
+            pool_sizes=parse_pool_sizes(os.environ.get('HTTP_POOL_SIZES')),
+            pool_block=os.environ.get('HTTP_POOL_BLOCK', 'false').lower() in ('1', 'true', 'yes')
+        )
+
+    @staticmethod
+    def upstream_of(url):
+        """Ключ upstream: scheme://host:port"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _session(self, upstream):
+        session = self._sessions.get(upstream)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(upstream)
+            if session is None:
+                size = self.pool_sizes.get(urlsplit(upstream).netloc, self.pool_size)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, pool_block=self.pool_block)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                # Сессия общая для всех пользователей: cookie между запросами не сохраняем
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                self._sessions[upstream] = session
+                self._requests[upstream] = 0
+                self._errors[upstream] = 0
+            return session
+
+    def request(self, method, url, **kwargs):
+        """Выполнить запрос через пул соединений upstream"""
+        upstream = self.upstream_of(url)
+        session = self._session(upstream)
+        with self._lock:
+            self._requests[upstream] += 1
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._errors[upstream] += 1
+            self._observe(method, upstream, url, 'error', started)
+            raise
+        self._observe(method, upstream, url, response.status_code, started)
+        return response
+
+    def _observe(self, method, upstream, url, status, started):
+        if self.observer is not None:
+            self.observer(method, upstream, urlsplit(url).path, status, time.perf_counter() - started)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        """Метрики пулов: запросы, открытые соединения и доля переиспользования"""
+        result = {}
+        with self._lock:
+            sessions = list(self._sessions.items())
+        for upstream, session in sessions:
+            adapter = session.get_adapter(upstream)
+            pools = adapter.poolmanager.pools
+            opened = 0
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+            total = self._requests[upstream]
+            result[upstream] = {
+                'pool_maxsize': adapter._pool_maxsize,
+                'requests': total,
+                'errors': self._errors[upstream],
+                'connections_opened': opened,
+                'connections_reused': max(total - opened, 0),
+                'reuse_rate': round(max(total - opened, 0) / total, 4) if total else 0.0
+            }
+        return result
@@ -0,0 +1,157 @@
+"""
+Circuit breaker и политика повторов для проксирования в API Gateway
+
+Для каждого upstream (базового URL сервиса) ведется свой circuit breaker:
+closed -> open после серии сбоев, open -> half-open по истечении паузы,
+half-open -> closed после успешного пробного запроса. Пока breaker открыт,
+gateway сразу отвечает 503, не занимая воркер ожиданием больного сервиса.
+"""
+
+import os
+import random
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Методы, которые безопасно повторять после отправки запроса
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Ответы сервиса, которые считаются сбоем upstream
+FAILURE_STATUS_CODES = {502, 503, 504}
+
+
+class CircuitBreaker:
+    """Circuit breaker одного upstream"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.half_open_calls = 0
+        self.total_failures = 0
+        self.total_successes = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Можно ли сейчас отправить запрос в upstream"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self.half_open_calls = 0
+            if self.state == HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self.half_open_calls += 1
+            return True
+
+    def record_success(self):
+        """Успешный ответ: breaker закрывается"""
+        with self._lock:
+            self.total_successes += 1
+            self.consecutive_failures = 0
+            self.state = CLOSED
+            self.opened_at = None
+
+    def record_failure(self):
+        """Сбой upstream: после порога (или в half-open) breaker открывается"""
+        with self._lock:
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        """Сколько секунд осталось до пробного запроса (для заголовка Retry-After)"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0
+            return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0)
+
+    def snapshot(self):
+        """Состояние breaker для диагностики"""
+        retry_after = self.retry_after()
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'retry_after': round(retry_after, 1),
+                'total_failures': self.total_failures,
+                'total_successes': self.total_successes,
+                'rejected': self.rejected
+            }
+
+
+class CircuitBreakerRegistry:
+    """Circuit breaker на каждый upstream, создаются по первому обращению"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Настройки из GATEWAY_CB_FAILURE_THRESHOLD / GATEWAY_CB_RESET_TIMEOUT"""
+        return cls(
+            failure_threshold=int(os.environ.get('GATEWAY_CB_FAILURE_THRESHOLD', 5)),
+            reset_timeout=float(os.environ.get('GATEWAY_CB_RESET_TIMEOUT', 30)),
+            half_open_max_calls=int(os.environ.get('GATEWAY_CB_HALF_OPEN_CALLS', 1))
+        )
+
+    def get(self, upstream):
+        """Breaker для upstream"""
+        breaker = self._breakers.get(upstream)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(upstream, CircuitBreaker(
+                    upstream, self.failure_threshold, self.reset_timeout, self.half_open_max_calls
+                ))
+        return breaker
+
+    def snapshot(self):
+        """Состояние всех breaker'ов"""
+        return {name: breaker.snapshot() for name, breaker in list(self._breakers.items())}
+
+
+class RetryPolicy:
+    """Повторы с экспоненциальной задержкой и jitter, с учетом идемпотентности"""
+
+    def __init__(self, max_attempts=3, backoff_base=0.1, backoff_max=2.0):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @classmethod
+    def from_env(cls):
+        """Настройки из GATEWAY_RETRIES / GATEWAY_BACKOFF_BASE / GATEWAY_BACKOFF_MAX"""
+        return cls(
+            max_attempts=int(os.environ.get('GATEWAY_RETRIES', 3)),
+            backoff_base=float(os.environ.get('GATEWAY_BACKOFF_BASE', 0.1)),
+            backoff_max=float(os.environ.get('GATEWAY_BACKOFF_MAX', 2.0))
+        )
+
+    @staticmethod
+    def is_safe_to_retry(method, connect_failed):
+        """POST повторяем только если соединение не было установлено (запрос точно не обработан)"""
+        return connect_failed or method.upper() in IDEMPOTENT_METHODS
+
+    def backoff(self, attempt):
+        """Задержка перед повтором номер attempt (full jitter)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
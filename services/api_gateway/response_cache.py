@@ -0,0 +1,222 @@
+"""
+Кэш ответов публичных GET маршрутов в API Gateway (LRU по байтам + TTL)
+
+Каталог курсов и списки уроков одинаковы для всех пользователей, поэтому
+повторные запросы отдаются из памяти gateway без похода в Course/Learning
+Service (и дальше в Auth Service). Каждый ответ получает strong ETag по
+содержимому, по If-None-Match клиенту отдается 304 без тела. Записи
+помечаются тегами (маршрут и маршрут:параметр) и сбрасываются, когда
+gateway проксирует изменяющий запрос к тем же данным (см. CACHE_PURGES).
+Сброс увеличивает поколение тегов: ответ, запрошенный у сервиса до сброса
+и полученный после него, может содержать старые данные и не сохраняется.
+Сброс действует только в своем процессе: если gateway запущен в нескольких
+копиях (GATEWAY_REPLICAS реплик по GUNICORN_WORKERS воркеров), изменение
+через одну копию не сбрасывает кэш остальных, поэтому TTL ограничивается
+GATEWAY_CACHE_SHARED_TTL - настолько могут отставать остальные копии.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Заголовки ответа, которые нужны в 304 (RFC 7232, 4.1)
+NOT_MODIFIED_HEADERS = ('etag', 'cache-control', 'vary', 'expires', 'content-location')
+
+CacheEntry = namedtuple('CacheEntry', ['status', 'headers', 'body', 'etag', 'tags', 'expires_at'])
+
+# Ответ сервиса, прочитанный целиком (тело как есть, без распаковки)
+BufferedResponse = namedtuple('BufferedResponse', ['status_code', 'headers', 'body'])
+
+
+def make_etag(body):
+    """Strong ETag по содержимому тела"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Совпадает ли If-None-Match клиента с ETag (слабое сравнение, RFC 7232, 3.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == etag:
+            return True
+    return False
+
+
+def accepted_encoding(accept_encoding):
+    """Вариант тела для ключа кэша: gzip или без сжатия"""
+    return 'gzip' if 'gzip' in (accept_encoding or '').lower() else 'identity'
+
+
+def cache_tags(endpoint, view_args):
+    """Теги записи: маршрут целиком и маршрут с каждым параметром (get_lessons:5)"""
+    return frozenset([endpoint] + [f'{endpoint}:{value}' for _, value in sorted(view_args.items())])
+
+
+def purge_tags(purges, view_args):
+    """Теги, которые сбрасывает изменяющий запрос (шаблоны из CACHE_PURGES)"""
+    return [tag.format(**view_args) for tag in purges]
+
+
+def without_length(headers):
+    """Заголовки без Content-Length (его выставляет сервер gateway по фактическому телу)"""
+    return [(name, value) for name, value in headers if name.lower() != 'content-length']
+
+
+def not_modified_headers(headers):
+    """Заголовки сохраненного ответа, которые передаются с 304"""
+    return [(name, value) for name, value in headers if name.lower() in NOT_MODIFIED_HEADERS]
+
+
+class ResponseCache:
+    """Потокобезопасный кэш ответов с ограничением общего объема тел"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=1024 * 1024, ttl=60, copies=1, shared_ttl=1):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        # Процессов gateway с собственным кэшем; сброс в одном не виден остальным
+        self.copies = copies
+        self.ttl = min(ttl, shared_ttl) if copies > 1 else ttl
+        self._entries = OrderedDict()
+        # Тег -> число сбросов (поколение)
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.stores = 0
+        self.too_large = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.purged = 0
+        self.stale_discarded = 0
+        self.bytes_served = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_bytes=int(os.environ.get('GATEWAY_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+            max_entry_bytes=int(os.environ.get('GATEWAY_CACHE_MAX_ENTRY_BYTES', 1024 * 1024)),
+            ttl=float(os.environ.get('GATEWAY_CACHE_TTL', 60)),
+            copies=int(os.environ.get('GATEWAY_REPLICAS', 1)) * int(os.environ.get('GUNICORN_WORKERS', 1)),
+            shared_ttl=float(os.environ.get('GATEWAY_CACHE_SHARED_TTL', 1))
+        )
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 and self.ttl > 0
+
+    def get(self, key):
+        """Запись кэша или None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def record_served(self, entry, not_modified):
+        """Учесть отданный из кэша ответ (304 без тела или полный)"""
+        with self._lock:
+            if not_modified:
+                self.not_modified += 1
+            else:
+                self.bytes_served += len(entry.body)
+
+    def generation(self, tags):
+        """Поколение тегов записи; берется до запроса к сервису и передается в put"""
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in sorted(tags))
+
+    def put(self, key, status, headers, body, tags, generation=None):
+        """Сохранить ответ; вернуть запись (с ETag) даже если она не поместилась в кэш
+
+        Если теги сбрасывались после generation (изменение пришло, пока ответ
+        шел от сервиса), ответ отдается клиенту, но в кэш не попадает.
+        """
+        headers = [(name, value) for name, value in without_length(headers) if name.lower() != 'etag']
+        etag = make_etag(body)
+        headers.append(('ETag', etag))
+        if not any(name.lower() == 'cache-control' for name, _ in headers):
+            # Клиент может хранить ответ, но перед использованием проверяет его по ETag
+            headers.append(('Cache-Control', 'no-cache'))
+        entry = CacheEntry(status, headers, body, etag, tags, time.monotonic() + self.ttl)
+
+        if len(body) > self.max_entry_bytes or len(body) > self.max_bytes:
+            with self._lock:
+                self.too_large += 1
+            return entry
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations.get(tag, 0) for tag in sorted(tags)):
+                self.stale_discarded += 1
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.bytes += len(body)
+            self.stores += 1
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def purge(self, tags):
+        """Сбросить записи с любым из тегов"""
+        tags = set(tags)
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            keys = [key for key, entry in self._entries.items() if entry.tags & tags]
+            for key in keys:
+                self._remove(key)
+            self.purged += len(keys)
+        return len(keys)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= len(entry.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Счетчики попаданий и объема для подбора размера кэша"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'max_entry_bytes': self.max_entry_bytes,
+                'ttl': self.ttl,
+                'copies': self.copies,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'stores': self.stores,
+                'too_large': self.too_large,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'purged': self.purged,
+                'stale_discarded': self.stale_discarded,
+                'bytes_served': self.bytes_served,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
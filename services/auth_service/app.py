@@ -2,12 +2,21 @@
 Auth Service - Микросервис аутентификации и авторизации
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from datetime import datetime
+from itertools import islice
+import hashlib
+import json
 import jwt
 import os
+import secrets
+import time
+from metrics import init_metrics
+from password_hasher import PasswordHasher, HasherBusy
+from user_import import BrokenUpload, batched, parse_row, read_rows, upload_format
 
 app = Flask(__name__)
 
@@ -31,6 +40,31 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Метрики Prometheus (GET /metrics): маршруты и SQL запросы
+init_metrics(app, db)
+
+# KDF паролей выполняется в пуле процессов с ограниченной очередью (см. password_hasher.py)
+password_hasher = PasswordHasher.from_env()
+
+# Короткоживущий access токен (JWT): сервисы проверяют только подпись и exp,
+# а БД читается раз в ACCESS_TOKEN_TTL при обмене refresh токена (секунды)
+app.config['ACCESS_TOKEN_TTL'] = int(os.environ.get('ACCESS_TOKEN_TTL', 900))
+app.config['REFRESH_TOKEN_TTL'] = int(os.environ.get('REFRESH_TOKEN_TTL', 30 * 24 * 3600))
+# Активных refresh токенов на пользователя (входов с разных устройств); старые удаляются
+app.config['REFRESH_TOKENS_PER_USER'] = int(os.environ.get('REFRESH_TOKENS_PER_USER', 10))
+
+# Размер страницы /revocations (сервисы догружают отзывы постранично)
+REVOCATIONS_PAGE_SIZE = 1000
+# Максимум id в одном запросе POST /users/batch
+USERS_BATCH_MAX_IDS = 1000
+
+# Массовый импорт: строк на проверку уникальности (два запроса IN на пакет),
+# максимум строк в одной загрузке и максимум секунд хеширования до вставки
+# накопленных строк (результаты уходят клиенту не реже, чем раз в интервал)
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+app.config['IMPORT_MAX_ROWS'] = int(os.environ.get('IMPORT_MAX_ROWS', 100000))
+app.config['IMPORT_COMMIT_INTERVAL'] = float(os.environ.get('IMPORT_COMMIT_INTERVAL', 2))
+
 
 class User(db.Model):
     """Модель пользователя"""
@@ -42,6 +76,93 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class TokenRevocation(db.Model):
+    """Отзыв токенов пользователя: недействительны все токены, выпущенные не позже revoked_at"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    # Unix time с долями секунды, сравнивается с iat токена: вход сразу после
+    # "выйти везде" в ту же секунду не должен попадать под отзыв
+    revoked_at = db.Column(db.Float, nullable=False)
+
+
+class RefreshToken(db.Model):
+    """Refresh токен: хранится только SHA-256 токена, сам токен есть лишь у клиента"""
+    token_hash = db.Column(db.LargeBinary(32), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    expires_at = db.Column(db.Integer, nullable=False)  # Unix time
+
+
+def revoke_user_tokens(user_id):
+    """Отозвать все ранее выпущенные токены пользователя"""
+    db.session.add(TokenRevocation(user_id=user_id, revoked_at=time.time()))
+    RefreshToken.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+
+def token_revoked(user_id, issued_at):
+    """Выпущен ли токен не позже последнего отзыва токенов пользователя"""
+    revoked_at = db.session.query(db.func.max(TokenRevocation.revoked_at)).filter_by(user_id=user_id).scalar()
+    if revoked_at is None:
+        return False
+    return not isinstance(issued_at, (int, float)) or issued_at <= revoked_at
+
+
+def refresh_token_hash(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+def issue_access_token(user):
+    """JWT access токен на ACCESS_TOKEN_TTL секунд"""
+    now = time.time()
+    return jwt.encode({
+        'user_id': user.id,
+        'username': user.username,
+        'role': user.role,
+        # NumericDate с долями секунды (RFC 7519), для сравнения с revoked_at
+        'iat': now,
+        'exp': int(now) + app.config['ACCESS_TOKEN_TTL']
+    }, app.config['SECRET_KEY'], algorithm='HS256')
+
+
+def issue_refresh_token(user_id):
+    """Новый refresh токен (сохраняется при commit); истекшие и лишние токены пользователя удаляются"""
+    now = int(time.time())
+    RefreshToken.query.filter(
+        RefreshToken.user_id == user_id, RefreshToken.expires_at <= now
+    ).delete(synchronize_session=False)
+    keep = max(app.config['REFRESH_TOKENS_PER_USER'] - 1, 0)
+    stale = [row.token_hash for row in db.session.query(RefreshToken.token_hash).filter_by(
+        user_id=user_id
+    ).order_by(RefreshToken.expires_at.desc()).offset(keep)]
+    if stale:
+        RefreshToken.query.filter(RefreshToken.token_hash.in_(stale)).delete(synchronize_session=False)
+
+    token = secrets.token_urlsafe(32)
+    db.session.add(RefreshToken(
+        token_hash=refresh_token_hash(token),
+        user_id=user_id,
+        expires_at=now + app.config['REFRESH_TOKEN_TTL']
+    ))
+    return token
+
+
+def token_pair(user, refresh_token):
+    """Поля ответа с парой токенов"""
+    return {
+        'token': issue_access_token(user),
+        'token_type': 'Bearer',
+        'expires_in': app.config['ACCESS_TOKEN_TTL'],
+        'refresh_token': refresh_token,
+        'refresh_expires_in': app.config['REFRESH_TOKEN_TTL']
+    }
+
+
+def hasher_busy(error):
+    """Ответ при заполненной очереди хеширования паролей"""
+    response = jsonify({'error': 'Слишком много запросов входа, повторите попытку позже'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+
 def init_db():
     """Инициализация базы данных"""
     with app.app_context():
@@ -50,7 +171,7 @@ def init_db():
             admin = User(
                 username='admin',
                 email='admin@example.com',
-                password_hash=generate_password_hash('admin123'),
+                password_hash=generate_password_hash('admin123', method=password_hasher.method, salt_length=password_hasher.salt_length),
                 role='admin'
             )
             db.session.add(admin)
@@ -60,7 +181,7 @@ def init_db():
             teacher = User(
                 username='teacher',
                 email='teacher@example.com',
-                password_hash=generate_password_hash('teacher123'),
+                password_hash=generate_password_hash('teacher123', method=password_hasher.method, salt_length=password_hasher.salt_length),
                 role='teacher'
             )
             db.session.add(teacher)
@@ -92,10 +213,15 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({'error': 'Пользователь с таким email уже существует'}), 400
     
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy as e:
+        return hasher_busy(e)
+    
     user = User(
         username=username,
         email=email,
-        password_hash=generate_password_hash(password),
+        password_hash=password_hash,
         role=role
     )
     db.session.add(user)
@@ -121,18 +247,23 @@ def login():
     
     user = User.query.filter_by(username=username).first()
     
-    if user and check_password_hash(user.password_hash, password):
-        # Генерация JWT токена
-        token = jwt.encode({
-            'user_id': user.id,
-            'username': user.username,
-            'role': user.role,
-            'exp': datetime.utcnow() + timedelta(hours=24)
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+    try:
+        password_ok, new_hash = password_hasher.verify_and_update(user.password_hash, password) if user else (False, None)
+    except HasherBusy as e:
+        return hasher_busy(e)
+    
+    if password_ok:
+        if new_hash is not None:
+            # Хеш с устаревшими параметрами KDF заменяется при входе (пароль известен только сейчас)
+            user.password_hash = new_hash
+        
+        # Короткоживущий access токен и refresh токен для его продления
+        refresh_token = issue_refresh_token(user.id)
+        db.session.commit()
         
         return jsonify({
             'message': 'Успешный вход',
-            'token': token,
+            **token_pair(user, refresh_token),
             'user': {
                 'id': user.id,
                 'username': user.username,
@@ -144,6 +275,52 @@ def login():
     return jsonify({'error': 'Неверное имя пользователя или пароль'}), 401
 
 
+@app.route('/refresh', methods=['POST'])
+def refresh():
+    """Новый access токен по refresh токену; refresh токен одноразовый и заменяется новым"""
+    data = request.get_json(silent=True) or {}
+    token = data.get('refresh_token')
+    
+    if not token or not isinstance(token, str):
+        return jsonify({'error': 'Refresh токен не предоставлен'}), 400
+    
+    token_hash = refresh_token_hash(token)
+    stored = RefreshToken.query.get(token_hash)
+    if stored is None or stored.expires_at <= time.time():
+        return jsonify({'error': 'Недействительный или истекший refresh токен'}), 401
+    
+    # Удаление и проверка числа строк в одной транзакции: из двух одновременных
+    # обменов одного токена успешен только один
+    if not RefreshToken.query.filter_by(token_hash=token_hash).delete(synchronize_session=False):
+        db.session.rollback()
+        return jsonify({'error': 'Недействительный или истекший refresh токен'}), 401
+    
+    user = User.query.get(stored.user_id)
+    if not user:
+        db.session.commit()
+        return jsonify({'error': 'Пользователь не найден'}), 401
+    
+    refresh_token = issue_refresh_token(user.id)
+    db.session.commit()
+    
+    return jsonify(token_pair(user, refresh_token)), 200
+
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    """Выход: удалить refresh токен (access токен истечет сам через ACCESS_TOKEN_TTL)"""
+    data = request.get_json(silent=True) or {}
+    token = data.get('refresh_token')
+    
+    if not token or not isinstance(token, str):
+        return jsonify({'error': 'Refresh токен не предоставлен'}), 400
+    
+    RefreshToken.query.filter_by(token_hash=refresh_token_hash(token)).delete(synchronize_session=False)
+    db.session.commit()
+    
+    return jsonify({'message': 'Выход выполнен'}), 200
+
+
 @app.route('/validate', methods=['POST'])
 def validate_token():
     """Валидация JWT токена"""
@@ -154,6 +331,8 @@ def validate_token():
     
     try:
         payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        if token_revoked(payload['user_id'], payload.get('iat')):
+            return jsonify({'error': 'Токен отозван'}), 401
         user = User.query.get(payload['user_id'])
         
         if not user:
@@ -173,6 +352,59 @@ def validate_token():
         return jsonify({'error': 'Неверный токен'}), 401
 
 
+@app.route('/password-hasher/stats', methods=['GET'])
+def password_hasher_stats():
+    """Состояние пула хеширования паролей и число хешей с устаревшими параметрами KDF"""
+    stats = password_hasher.stats()
+    stats['outdated_hashes'] = User.query.filter(
+        ~User.password_hash.startswith(password_hasher.method + '$', autoescape=True)
+    ).count()
+    return jsonify(stats), 200
+
+
+@app.route('/revoke', methods=['POST'])
+def revoke():
+    """Отозвать токены: свои или (для администратора) любого пользователя"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'Требуется авторизация'}), 401
+    
+    try:
+        payload = jwt.decode(auth_header.split(' ')[1], app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Неверный или истекший токен'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id', payload['user_id'])
+    if not isinstance(user_id, int) or isinstance(user_id, bool):
+        return jsonify({'error': 'user_id должен быть целым числом'}), 400
+    if user_id != payload['user_id'] and payload.get('role') != 'admin':
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    revoke_user_tokens(user_id)
+    db.session.commit()
+    
+    return jsonify({'message': 'Токены отозваны', 'user_id': user_id}), 200
+
+
+@app.route('/revocations', methods=['GET'])
+def get_revocations():
+    """Отзывы токенов после указанного id (для локальной проверки JWT в сервисах)"""
+    since = request.args.get('since', 0, type=int)
+    revocations = TokenRevocation.query.filter(
+        TokenRevocation.id > since
+    ).order_by(TokenRevocation.id).limit(REVOCATIONS_PAGE_SIZE).all()
+    
+    return jsonify({
+        'revocations': [{
+            'id': r.id,
+            'user_id': r.user_id,
+            'revoked_at': r.revoked_at
+        } for r in revocations],
+        'last_id': revocations[-1].id if revocations else since
+    }), 200
+
+
 @app.route('/user/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Получить информацию о пользователе"""
@@ -186,6 +418,174 @@ def get_user(user_id):
     }), 200
 
 
+@app.route('/users/batch', methods=['POST'])
+def get_users_batch():
+    """Имена пользователей по списку id (для внутренних сервисов): {"ids": [1, 2]} -> {"usernames": {"1": "..."}}"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(user_id, int) for user_id in ids):
+        return jsonify({'error': 'Требуется список id пользователей'}), 400
+    if len(ids) > USERS_BATCH_MAX_IDS:
+        return jsonify({'error': f'Не больше {USERS_BATCH_MAX_IDS} id в одном запросе'}), 400
+    
+    rows = db.session.query(User.id, User.username).filter(User.id.in_(set(ids))).all() if ids else []
+    return jsonify({'usernames': {str(user_id): username for user_id, username in rows}}), 200
+
+
+def import_result(number, username, user_id=None, error=None):
+    """Строка ответа импорта (JSON lines)"""
+    result = {'row': number, 'username': username}
+    if error is None:
+        result.update(status='created', user_id=user_id)
+    else:
+        result.update(status='error', error=error)
+    return json.dumps(result) + '\n'
+
+
+def insert_import_batch(batch):
+    """Вставить пакет [(номер строки, поля)] одной транзакцией; вернуть {username: id}
+
+    Если за время хеширования те же имя или email зарегистрировали обычным
+    /register, пакет вставляется заново по одной строке.
+    """
+    statement = db.insert(User).returning(User.id, User.username)
+    try:
+        ids = dict((username, user_id) for user_id, username in db.session.execute(statement, [user for _, user in batch]))
+        db.session.commit()
+        return ids
+    except IntegrityError:
+        db.session.rollback()
+    
+    ids = {}
+    for _, user in batch:
+        try:
+            user_id, username = db.session.execute(statement, user).one()
+            db.session.commit()
+            ids[username] = user_id
+        except IntegrityError:
+            db.session.rollback()
+    return ids
+
+
+def import_users_stream(rows):
+    """Импорт пользователей; результат каждой строки отдается по мере вставки"""
+    started = time.perf_counter()
+    created = failed = 0
+    truncated = broken = False
+    busy = None
+    seen_usernames, seen_emails = set(), set()
+    limit = app.config['IMPORT_MAX_ROWS']
+    
+    def insert_pending(pending):
+        nonlocal created, failed
+        ids = insert_import_batch(pending)
+        for number, user in pending:
+            if user['username'] in ids:
+                created += 1
+                yield import_result(number, user['username'], user_id=ids[user['username']])
+            else:
+                failed += 1
+                yield import_result(number, user['username'], error='Пользователь с таким именем или email уже существует')
+    
+    for chunk in batched(enumerate(islice(rows, limit + 1), 1), app.config['IMPORT_BATCH_SIZE']):
+        candidates = []
+        for number, row in chunk:
+            if number > limit:
+                truncated = True
+                yield import_result(number, None, error=f'Превышен лимит строк ({limit}), остальные строки не импортированы')
+                break
+            user, error = parse_row(row)
+            broken = broken or isinstance(row, BrokenUpload)
+            if error is None and user['username'] in seen_usernames:
+                error = 'Имя пользователя повторяется в загрузке'
+            elif error is None and user['email'] in seen_emails:
+                error = 'Email повторяется в загрузке'
+            if error is not None:
+                failed += 1
+                yield import_result(number, row.get('username') if isinstance(row, dict) else None, error=error)
+                continue
+            seen_usernames.add(user['username'])
+            seen_emails.add(user['email'])
+            candidates.append((number, user))
+        
+        # Уникальность по БД: по одному запросу на имена и email всего пакета
+        usernames = {user['username'] for _, user in candidates}
+        emails = {user['email'] for _, user in candidates}
+        taken_usernames = {name for name, in db.session.query(User.username).filter(User.username.in_(usernames))} if usernames else set()
+        taken_emails = {email for email, in db.session.query(User.email).filter(User.email.in_(emails))} if emails else set()
+        accepted = []
+        for number, user in candidates:
+            if user['username'] in taken_usernames:
+                failed += 1
+                yield import_result(number, user['username'], error='Пользователь с таким именем уже существует')
+            elif user['email'] in taken_emails:
+                failed += 1
+                yield import_result(number, user['username'], error='Пользователь с таким email уже существует')
+            else:
+                accepted.append((number, user))
+        
+        # Хеширование на всех процессах пула; вставка накопленного раз в IMPORT_COMMIT_INTERVAL
+        hashes = password_hasher.hash_many([user.pop('password') for _, user in accepted])
+        pending = []
+        hashed = 0
+        flushed_at = time.monotonic()
+        try:
+            for password_hash, (number, user) in zip(hashes, accepted):
+                user['password_hash'] = password_hash
+                pending.append((number, user))
+                hashed += 1
+                if time.monotonic() - flushed_at < app.config['IMPORT_COMMIT_INTERVAL']:
+                    continue
+                yield from insert_pending(pending)
+                pending = []
+                flushed_at = time.monotonic()
+        except HasherBusy as e:
+            # Пул хеширования не освободился за PASSWORD_HASH_TIMEOUT: уже
+            # хешированные строки вставляются, остальные не импортируются
+            busy = e
+        if pending:
+            yield from insert_pending(pending)
+        
+        if busy is not None:
+            for number, user in accepted[hashed:]:
+                failed += 1
+                yield import_result(number, user['username'], error='Пул хеширования паролей перегружен, строка не импортирована')
+            print(f"User import stopped: {busy}")
+            break
+        if truncated:
+            break
+    
+    elapsed = time.perf_counter() - started
+    print(f"User import: {created} created, {failed} failed in {elapsed:.1f}s")
+    yield json.dumps({'summary': {
+        'rows': created + failed, 'created': created, 'failed': failed,
+        'truncated': truncated, 'aborted': busy is not None or broken, 'seconds': round(elapsed, 3)
+    }}) + '\n'
+
+
+@app.route('/users/import', methods=['POST'])
+def import_users():
+    """Массовый импорт пользователей (администратор): CSV или JSON lines, ответ - JSON lines по строкам"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'Требуется авторизация'}), 401
+    
+    try:
+        payload = jwt.decode(auth_header.split(' ')[1], app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Неверный или истекший токен'}), 401
+    
+    if payload.get('role') != 'admin':
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    fmt = upload_format(request.content_type)
+    if fmt is None:
+        return jsonify({'error': 'Ожидается text/csv или application/x-ndjson'}), 415
+    
+    rows = read_rows(request.stream, fmt)
+    return Response(stream_with_context(import_users_stream(rows)), mimetype='application/x-ndjson')
+
+
 @app.route('/users', methods=['GET'])
 def get_users():
     """Получить список пользователей (для внутренних сервисов)"""
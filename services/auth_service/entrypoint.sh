@@ -9,7 +9,13 @@ chmod 777 /app/data
 echo "Checking /app/data write permissions..."
 touch /app/data/.test_write && rm /app/data/.test_write && echo "✓ /app/data is writable" || echo "⚠ Warning: /app/data may not be writable"
 
-# Запустить приложение
-echo "Starting application..."
-exec python app.py
+# SERVER_MODE=dev - встроенный сервер Flask (python app.py) для локальной отладки
+if [ "${SERVER_MODE:-production}" = "dev" ]; then
+    echo "Starting application (Flask dev server)..."
+    exec python app.py
+fi
+
+# Продакшен: gunicorn, init_db() выполняется один раз до запуска воркеров (gunicorn.conf.py)
+echo "Starting application (gunicorn)..."
+exec gunicorn -c gunicorn.conf.py
 
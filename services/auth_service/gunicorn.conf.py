@@ -0,0 +1,85 @@
+"""
+Настройки gunicorn для продакшен запуска Auth Service (см. entrypoint.sh)
+
+Pre-fork: master процесс запускает GUNICORN_WORKERS воркеров по
+GUNICORN_THREADS потоков. init_db() (схема и миграции) выполняется один раз
+до запуска воркеров, в отдельном процессе: master не импортирует приложение
+и не держит соединений с БД, которые воркеры унаследовали бы после fork.
+SIGHUP - плавный перезапуск воркеров (с той же проверкой миграций).
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+wsgi_app = 'app:app'
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+# Половина потоков воркера зарезервирована для /validate и /user/<id> (см. ниже)
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Перезапуск воркера после N запросов (0 - без перезапуска)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+# Воркеры импортируют приложение сами, после fork
+preload_app = False
+
+# Метрики Prometheus со всех воркеров: prometheus_client пишет значения в файлы
+# этого каталога (multiprocess режим), GET /metrics любого воркера их суммирует
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus-metrics'))
+
+# SQLite в памяти существует только внутри процесса: схему создает сам воркер,
+# и воркер один, иначе у каждого были бы свои данные
+IN_MEMORY_DB = ':memory:' in os.environ.get('DATABASE_URL', 'sqlite:///:memory:')
+if IN_MEMORY_DB:
+    workers = 1
+
+# Пул хеширования паролей в каждом воркере: ядра делятся между воркерами, а
+# хеширования ждут не больше половины потоков, остальные обслуживают быстрые запросы
+os.environ.setdefault('PASSWORD_HASH_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+os.environ.setdefault('PASSWORD_HASH_MAX_PENDING', str(max(1, threads // 2)))
+
+
+def reset_metrics_dir():
+    """Пустой каталог метрик при старте (значения прошлого запуска не учитываются)"""
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def run_init_db():
+    """init_db() в отдельном процессе"""
+    subprocess.run(
+        [sys.executable, '-c', 'from app import init_db; init_db()'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+
+
+def on_starting(server):
+    """Схема и миграции БД один раз перед запуском воркеров"""
+    reset_metrics_dir()
+    if not IN_MEMORY_DB:
+        run_init_db()
+
+
+def on_reload(server):
+    """SIGHUP: миграции новой версии кода до запуска новых воркеров"""
+    if not IN_MEMORY_DB:
+        run_init_db()
+
+
+def post_worker_init(worker):
+    if IN_MEMORY_DB:
+        from app import init_db
+        init_db()
+
+
+def child_exit(server, worker):
+    """Значения gauge завершившегося воркера больше не учитываются"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
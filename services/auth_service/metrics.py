@@ -0,0 +1,128 @@
+"""
+Метрики Prometheus: задержки маршрутов, запросы к БД и вызовы других сервисов
+
+Один и тот же модуль во всех сервисах. init_metrics(app) подключает к
+Flask приложению учет каждого запроса (гистограмма задержки по маршруту,
+число запросов в обработке, число и время SQL запросов за запрос) и
+GET /metrics в текстовом формате Prometheus. Вызовы других сервисов
+учитываются через observe_upstream() (PooledHttpClient.observer).
+
+Под gunicorn метрики всех воркеров собираются через multiprocess режим
+prometheus_client (PROMETHEUS_MULTIPROC_DIR задает gunicorn.conf.py).
+"""
+
+import os
+import re
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Сегменты пути, которые заменяются шаблоном, чтобы число рядов метрик не росло
+ID_SEGMENT_RE = re.compile(r'/(\d+|[0-9a-f]{64})(?=/|$)')
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ['method', 'route', 'status']
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Запросы в обработке', ['method', 'route'], multiprocess_mode='livesum'
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'Число SQL запросов за один HTTP запрос', ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    'db_time_per_request_seconds', 'Суммарное время SQL запросов за один HTTP запрос', ['route']
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Время одного SQL запроса', ['route']
+)
+UPSTREAM_LATENCY = Histogram(
+    'upstream_request_duration_seconds', 'Время запроса к другому сервису (до заголовков ответа)',
+    ['upstream', 'endpoint', 'method', 'status']
+)
+
+
+def endpoint_template(path):
+    """Путь без query string и с шаблоном вместо id: /courses/5/lessons -> /courses/<id>/lessons"""
+    return ID_SEGMENT_RE.sub('/<id>', path.split('?', 1)[0]) or '/'
+
+
+def observe_upstream(method, upstream, path, status, seconds):
+    """Учесть вызов другого сервиса; status - код ответа или 'error'"""
+    UPSTREAM_LATENCY.labels(upstream, endpoint_template(path), method, str(status)).observe(seconds)
+
+
+def metrics_payload():
+    """Текст метрик для GET /metrics (со всех воркеров gunicorn, если он запущен)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def current_route():
+    """Шаблон маршрута Flask (/lessons/<int:lesson_id>), а не фактический путь"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get('query_started')
+    if not stack:
+        return
+    started = stack.pop()
+    # Учитываются только SQL запросы обработчиков HTTP запросов
+    if has_request_context() and 'metrics_started' in g:
+        elapsed = time.perf_counter() - started
+        g.db_queries += 1
+        g.db_time += elapsed
+        DB_QUERY_LATENCY.labels(current_route()).observe(elapsed)
+
+
+def init_metrics(app, db=None):
+    """Подключить метрики к Flask приложению (db - учитывать SQL запросы)"""
+    if db is not None:
+        # SQLAlchemy есть не во всех сервисах (gateway, frontend)
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+        REQUESTS_IN_PROGRESS.labels(request.method, current_route()).inc()
+
+    @app.teardown_request
+    def finish_request_metrics(error=None):
+        if 'metrics_started' not in g:
+            return
+        route = current_route()
+        status = getattr(g, 'metrics_status', 500 if error is not None else 200)
+        REQUESTS_IN_PROGRESS.labels(request.method, route).dec()
+        REQUEST_LATENCY.labels(request.method, route, str(status)).observe(time.perf_counter() - g.metrics_started)
+        if db is not None:
+            DB_QUERIES_PER_REQUEST.labels(route).observe(g.db_queries)
+            DB_TIME_PER_REQUEST.labels(route).observe(g.db_time)
+        del g.metrics_started
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Метрики в текстовом формате Prometheus"""
+        return Response(metrics_payload(), content_type=CONTENT_TYPE_LATEST)
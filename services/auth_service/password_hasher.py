@@ -0,0 +1,245 @@
+"""
+Хеширование паролей в отдельном пуле процессов для Auth Service
+
+generate_password_hash/check_password_hash - намеренно дорогие KDF. В
+потоке запроса они занимают GIL воркера, и при массовом входе (начало
+семестра) запросы /validate и /user/<id> ждут за ними. PasswordHasher
+выполняет KDF в пуле процессов по числу ядер, а число запросов, ожидающих
+хеширования, ограничено: остальные потоки воркера всегда свободны для
+быстрых запросов, а сверх лимита вызывающий получает HasherBusy (429 с
+Retry-After) вместо бесконечной очереди.
+
+Параметры KDF задаются PASSWORD_HASH_METHOD в формате Werkzeug
+(pbkdf2:sha256:600000, scrypt:32768:8:1). Хеш с другими параметрами
+проверяется как раньше и при успешном входе пересчитывается с текущими
+(verify_and_update), поэтому параметры можно менять без сброса паролей.
+Подбор параметров: python benchmarks/password_hashing.py.
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+
+class HasherBusy(Exception):
+    """Очередь хеширования заполнена; retry_after - через сколько секунд повторить"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'password hasher is busy, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+def normalize_method(method):
+    """Полная запись параметров KDF, как в сохраненном хеше: pbkdf2 -> pbkdf2:sha256:600000"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        if not args:
+            args = [str(2 ** 15), '8', '1']
+        if len(args) != 3:
+            raise ValueError("'scrypt' takes 3 arguments: scrypt:n:r:p")
+        n, r, p = map(int, args)
+        return f'scrypt:{n}:{r}:{p}'
+    if name == 'pbkdf2':
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' takes 2 arguments: pbkdf2:hash:iterations")
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f'unsupported password hash method: {method}')
+
+
+def hash_method(password_hash):
+    """Параметры KDF сохраненного хеша (часть до первого $)"""
+    return password_hash.split('$', 1)[0]
+
+
+def _hash(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def _verify(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+def _verify_and_update(password_hash, password, method, salt_length):
+    # Один вызов пула: проверка и, если параметры устарели, новый хеш
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if hash_method(password_hash) == method:
+        return True, None
+    return True, generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+class PasswordHasher:
+    """Пул процессов для KDF с ограниченной очередью"""
+
+    def __init__(self, workers=None, max_pending=4, timeout=10, method=DEFAULT_METHOD, salt_length=16):
+        self.method = normalize_method(method)
+        self.salt_length = salt_length
+        self.workers = workers or os.cpu_count() or 1
+        # Задач одновременно в пуле (выполняются + ждут в очереди пула). Место
+        # освобождается, когда задача завершилась, а не когда вызывающий
+        # перестал ждать: после таймаута очередь пула не растет сверх лимита
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+        # Скользящее среднее времени одного хеширования (для Retry-After)
+        self.avg_seconds = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None,
+            max_pending=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 4)),
+            timeout=float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10)),
+            method=os.environ.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+            salt_length=int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+        )
+
+    def _executor(self):
+        # Пул создается при первом вызове, уже в воркере gunicorn. spawn, а не
+        # fork: воркер многопоточный, fork мог бы скопировать захваченные блокировки
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def retry_after(self):
+        """Оценка времени до освобождения места в очереди, секунды"""
+        return max(1, math.ceil(self.avg_seconds * (self.pending + 1) / self.workers))
+
+    def _release(self, future=None):
+        with self._stats_lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _submit(self, fn, *args):
+        """Отправить задачу в пул на уже занятое место; место освобождается по ее завершении"""
+        with self._stats_lock:
+            self.pending += 1
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException as e:
+            self._release()
+            if isinstance(e, BrokenProcessPool):
+                with self._pool_lock:
+                    self._pool = None
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _result(self, future, started=None):
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Задача в очереди пула отменяется; уже выполняющаяся держит место до завершения
+            future.cancel()
+            with self._stats_lock:
+                self.timeouts += 1
+            raise HasherBusy(self.retry_after())
+        except BrokenProcessPool:
+            # Процесс пула упал: следующий вызов создаст новый пул
+            with self._pool_lock:
+                self._pool = None
+            raise
+        with self._stats_lock:
+            self.completed += 1
+            if started is not None:
+                elapsed = time.perf_counter() - started
+                self.avg_seconds = elapsed if not self.avg_seconds else 0.9 * self.avg_seconds + 0.1 * elapsed
+        return result
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise HasherBusy(self.retry_after())
+        started = time.perf_counter()
+        return self._result(self._submit(fn, *args), started)
+
+    def hash(self, password):
+        """Хеш нового пароля с текущими параметрами"""
+        return self._run(_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        """Проверка пароля (как check_password_hash)"""
+        return self._run(_verify, password_hash, password)
+
+    def hash_many(self, passwords):
+        """Хеши паролей в том же порядке (итератор) для массового импорта
+
+        Каждая задача занимает место в очереди (ждет его до timeout, а не сразу
+        бросает HasherBusy), но в пуле одновременно не больше половины мест и
+        не больше 2 задач на процесс: остальные места остаются входам
+        пользователей, и вход не встает в очередь пула за всем файлом.
+        """
+        limit = max(1, min(self.workers * 2, self.max_pending // 2))
+        in_flight = deque()
+        try:
+            for password in passwords:
+                if len(in_flight) >= limit:
+                    yield self._result(in_flight.popleft())
+                if not self._slots.acquire(timeout=self.timeout):
+                    with self._stats_lock:
+                        self.rejected += 1
+                    raise HasherBusy(self.retry_after())
+                in_flight.append(self._submit(_hash, password, self.method, self.salt_length))
+            while in_flight:
+                yield self._result(in_flight.popleft())
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def needs_rehash(self, password_hash):
+        """Сохраненный хеш посчитан с другими параметрами"""
+        return hash_method(password_hash) != self.method
+
+    def verify_and_update(self, password_hash, password):
+        """(пароль верен, новый хеш или None): новый хеш - если параметры хеша устарели"""
+        if not self.needs_rehash(password_hash):
+            return self.verify(password_hash, password), None
+        ok, new_hash = self._run(_verify_and_update, password_hash, password, self.method, self.salt_length)
+        if new_hash is not None:
+            with self._stats_lock:
+                self.rehashed += 1
+        return ok, new_hash
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self):
+        """Счетчики для диагностики и подбора размера пула"""
+        with self._stats_lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'rehashed': self.rehashed,
+                'avg_hash_ms': round(self.avg_seconds * 1000, 1)
+            }
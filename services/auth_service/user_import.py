@@ -0,0 +1,86 @@
+"""
+Разбор загрузки для массового импорта пользователей (POST /users/import)
+
+Тело запроса читается потоком, по строке: CSV с заголовком
+(username,email,password[,role]) или JSON lines - по объекту с теми же
+полями в строке. Память не зависит от размера файла. Если загрузка не
+читается дальше (битый CSV, не UTF-8), последней строкой отдается
+BrokenUpload с причиной, и импорт останавливается на ней.
+"""
+
+import codecs
+import csv
+import json
+from collections import namedtuple
+from itertools import islice
+
+ROLES = ('student', 'teacher', 'admin')
+# Content-Type загрузки -> формат
+FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/json-lines': 'jsonl',
+}
+
+# Строка, на которой чтение загрузки прервалось
+BrokenUpload = namedtuple('BrokenUpload', ['error'])
+
+
+def upload_format(content_type):
+    """Формат загрузки по Content-Type или None"""
+    return FORMATS.get((content_type or '').split(';', 1)[0].strip().lower())
+
+
+def read_rows(stream, fmt):
+    """Строки загрузки как словари (None - строка JSON lines не разобрана)"""
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    try:
+        if fmt == 'csv':
+            yield from csv.DictReader(lines)
+            return
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+    except UnicodeDecodeError:
+        yield BrokenUpload('Загрузка не в кодировке UTF-8, остальные строки не импортированы')
+    except csv.Error as e:
+        yield BrokenUpload(f'Ошибка разбора CSV ({e}), остальные строки не импортированы')
+
+
+def parse_row(row):
+    """(поля пользователя, None) или (None, ошибка)"""
+    if isinstance(row, BrokenUpload):
+        return None, row.error
+    if row is None:
+        return None, 'Строка не является JSON объектом'
+    # Числа и true/false из JSON не превращаются в имена и пароли молча
+    for field in ('username', 'email', 'password', 'role'):
+        if row.get(field) is not None and not isinstance(row[field], str):
+            return None, f'Поле {field} должно быть строкой'
+    username = (row.get('username') or '').strip()
+    email = (row.get('email') or '').strip()
+    password = row.get('password') or ''
+    role = (row.get('role') or 'student').strip()
+    if not username or not email or not password:
+        return None, 'Не все поля заполнены'
+    if len(username) > 80 or len(email) > 120:
+        return None, 'Слишком длинное имя пользователя или email'
+    if role not in ROLES:
+        return None, f'Неизвестная роль: {role}'
+    return {'username': username, 'email': email, 'password': password, 'role': role}, None
+
+
+def batched(iterable, size):
+    """Пакеты по size элементов"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -4,9 +4,19 @@ Course Service - Микросервис управления курсами
 
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import load_only
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
-import requests
+from jwt_auth import INTERNAL_TOKEN_HEADER, LocalTokenVerifier, is_internal_request, load_internal_token, load_jwt_secret
+from token_cache import MISS, TokenCache
+from http_client import PooledHttpClient
+from metrics import init_metrics, observe_upstream
+from blob_store import BlobStore, decode_image, send_blob
+from user_names import UserNameCache
+from pagination import parse_page, fetch_page
+from migrations import COURSE_SEARCH, init_schema
+from search_index import parse_search
 
 app = Flask(__name__)
 
@@ -19,9 +29,132 @@ else:
     print(f"Database URI: {db_uri}")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['AUTH_SERVICE_URL'] = os.environ.get('AUTH_SERVICE_URL', 'http://localhost:5001')
+# Локальная проверка JWT (без запроса к Auth Service /validate на каждый вызов)
+app.config['LOCAL_JWT_VERIFY'] = os.environ.get('LOCAL_JWT_VERIFY', 'true').lower() in ('1', 'true', 'yes')
+app.config['JWT_REVOCATION_POLL_INTERVAL'] = int(os.environ.get('JWT_REVOCATION_POLL_INTERVAL', 30))
+# Кэш удаленной валидации токенов (используется при LOCAL_JWT_VERIFY=false)
+app.config['TOKEN_CACHE_SIZE'] = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+app.config['TOKEN_CACHE_TTL'] = int(os.environ.get('TOKEN_CACHE_TTL', 60))
+app.config['TOKEN_CACHE_NEGATIVE_TTL'] = int(os.environ.get('TOKEN_CACHE_NEGATIVE_TTL', 5))
+# Кэш имен создателей курсов (id -> username из Auth Service)
+app.config['USER_NAME_CACHE_SIZE'] = int(os.environ.get('USER_NAME_CACHE_SIZE', 10000))
+app.config['USER_NAME_CACHE_TTL'] = int(os.environ.get('USER_NAME_CACHE_TTL', 300))
+# Максимум id в одном пакетном запросе GET /courses?ids=...
+app.config['COURSE_BATCH_MAX_IDS'] = int(os.environ.get('COURSE_BATCH_MAX_IDS', 100))
+# Сервисы, которые кэшируют метаданные курсов (через запятую): при создании,
+# изменении и удалении курса им отправляется POST <url>/course-cache/invalidate.
+# Уведомление доходит до одного воркера одной реплики (best effort), остальные
+# узнают об изменении из журнала GET /course-changes
+app.config['COURSE_CHANGE_HOOK_URLS'] = [
+    url.strip() for url in os.environ.get('COURSE_CHANGE_HOOK_URLS', os.environ.get('LEARNING_SERVICE_URL', '')).split(',')
+    if url.strip()
+]
+# Записей в журнале изменений курсов (более старые удаляются)
+app.config['COURSE_CHANGE_LOG_SIZE'] = int(os.environ.get('COURSE_CHANGE_LOG_SIZE', 10000))
+# Keyset пагинация списков (?limit=&after=): размер страницы по умолчанию и максимум
+app.config['PAGE_SIZE_DEFAULT'] = int(os.environ.get('PAGE_SIZE_DEFAULT', 50))
+app.config['PAGE_SIZE_MAX'] = int(os.environ.get('PAGE_SIZE_MAX', 500))
+# Результатов поиска на странице по умолчанию (GET /courses/search)
+app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+# Хранилище баннеров курсов (сырые байты, адресация по SHA-256)
+app.config['BLOB_STORE_DIR'] = os.environ.get(
+    'BLOB_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'blobs')
+)
+# X-Sendfile: отдачу файлов изображений берет на себя фронтовой веб-сервер (nginx и т.п.)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() in ('1', 'true', 'yes')
 
 db = SQLAlchemy(app)
 
+# Общий пул keep-alive соединений для запросов к другим сервисам
+http_client = PooledHttpClient.from_env()
+
+# Метрики Prometheus (GET /metrics): маршруты, SQL запросы, вызовы других сервисов
+init_metrics(app, db)
+http_client.observer = observe_upstream
+
+jwt_secret = load_jwt_secret()
+# Токен вызовов от других сервисов (/courses/<id>/meta, /course-changes)
+internal_token = load_internal_token(jwt_secret)
+token_verifier = LocalTokenVerifier(
+    jwt_secret,
+    app.config['AUTH_SERVICE_URL'],
+    app.config['JWT_REVOCATION_POLL_INTERVAL'],
+    http_client
+)
+token_cache = TokenCache(
+    app.config['TOKEN_CACHE_SIZE'],
+    app.config['TOKEN_CACHE_TTL'],
+    app.config['TOKEN_CACHE_NEGATIVE_TTL']
+)
+blob_store = BlobStore(app.config['BLOB_STORE_DIR'])
+
+
+# Совпадает с USERS_BATCH_MAX_IDS в Auth Service (больше id в запросе - 400)
+USERS_BATCH_MAX_IDS = 1000
+
+
+def fetch_usernames(user_ids):
+    """Имена пользователей из Auth Service запросами POST /users/batch по USERS_BATCH_MAX_IDS id
+
+    None, если хотя бы один запрос не удался: иначе id из него попали бы в
+    кэш как несуществующие пользователи.
+    """
+    usernames = {}
+    for start in range(0, len(user_ids), USERS_BATCH_MAX_IDS):
+        try:
+            response = http_client.post(
+                f"{app.config['AUTH_SERVICE_URL']}/users/batch",
+                json={'ids': user_ids[start:start + USERS_BATCH_MAX_IDS]},
+                timeout=2
+            )
+            if response.status_code != 200:
+                print(f"User names lookup failed: {response.status_code}")
+                return None
+            usernames.update((int(user_id), name) for user_id, name in response.json()['usernames'].items())
+        except Exception as e:
+            print(f"User names lookup failed: {e}")
+            return None
+    return usernames
+
+
+def record_course_change(course_id):
+    """Записать изменение курса в журнал (в текущей транзакции) и удалить старые записи"""
+    change = CourseChange(course_id=course_id)
+    db.session.add(change)
+    db.session.flush()
+    CourseChange.query.filter(
+        CourseChange.id <= change.id - app.config['COURSE_CHANGE_LOG_SIZE']
+    ).delete(synchronize_session=False)
+
+
+def notify_course_changed(course_id):
+    """Уведомить сервисы с кэшем метаданных курсов (в фоне, без ожидания ответа)"""
+    for url in app.config['COURSE_CHANGE_HOOK_URLS']:
+        notify_pool.submit(send_course_change, url, course_id)
+
+
+def send_course_change(url, course_id):
+    try:
+        response = http_client.post(
+            f"{url}/course-cache/invalidate",
+            json={'course_id': course_id},
+            headers={INTERNAL_TOKEN_HEADER: internal_token},
+            timeout=2
+        )
+        if response.status_code != 200:
+            print(f"Course change notification to {url} failed: {response.status_code}")
+    except Exception as e:
+        # Получатель узнает об изменении из журнала /course-changes
+        print(f"Course change notification to {url} failed: {e}")
+
+
+notify_pool = ThreadPoolExecutor(max_workers=1)
+user_names = UserNameCache(
+    fetch_usernames,
+    app.config['USER_NAME_CACHE_SIZE'],
+    app.config['USER_NAME_CACHE_TTL']
+)
+
 
 class Course(db.Model):
     """Модель курса"""
@@ -31,19 +164,64 @@ class Course(db.Model):
     creator_id = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_published = db.Column(db.Boolean, default=False)
-    banner_image = db.Column(db.Text)  # Base64 изображение баннера
+    banner_image = db.Column(db.Text)  # SHA-256 баннера в хранилище блобов
+    
+    __table_args__ = (
+        db.Index('ix_course_creator_id', 'creator_id'),
+        # Каталог: опубликованные курсы по возрастанию id (keyset пагинация)
+        db.Index('ix_course_published_id', 'is_published', 'id'),
+    )
+
+
+class CourseChange(db.Model):
+    """Журнал изменений курсов: по нему сервисы сбрасывают кэши метаданных курсов"""
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, nullable=False)
+
+
+# Размер страницы GET /course-changes
+COURSE_CHANGES_PAGE_SIZE = 1000
+
+
+# Полнотекстовый индекс курсов (migrations.py); в новой БД создается вместе с таблицей course
+course_search = COURSE_SEARCH
+course_search.attach(Course.__table__)
+
+
+class ImageBlob(db.Model):
+    """Метаданные изображения из хранилища блобов (сами байты лежат на диске)"""
+    digest = db.Column(db.String(64), primary_key=True)  # SHA-256 содержимого
+    content_type = db.Column(db.String(100), nullable=False, default='image/png')
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 def validate_token(token):
-    """Валидация токена через Auth Service"""
+    """Валидация токена: локально по подписи или через Auth Service"""
+    if app.config['LOCAL_JWT_VERIFY']:
+        return token_verifier.verify(token)
+    return validate_token_remote(token)
+
+
+def validate_token_remote(token):
+    """Валидация токена через Auth Service (с кэшированием результата)"""
+    cached = token_cache.get(token)
+    if cached is not MISS:
+        return cached
+    
     try:
-        response = requests.post(
+        response = http_client.post(
             f"{app.config['AUTH_SERVICE_URL']}/validate",
             json={'token': token},
             timeout=2
         )
         if response.status_code == 200:
-            return response.json().get('user')
+            user = response.json().get('user')
+            token_cache.put(token, user)
+            return user
+        # Кэшируем только явный отказ Auth Service, а не сбои связи
+        if response.status_code in (400, 401, 404):
+            token_cache.put_negative(token)
         return None
     except:
         return None
@@ -74,6 +252,17 @@ def login_required(f):
     return decorated_function
 
 
+def internal_required(f):
+    """Декоратор для эндпоинтов, которые вызывают только другие сервисы"""
+    from functools import wraps
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_internal_request(request.headers, internal_token):
+            return jsonify({'error': 'Доступ запрещен'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 def teacher_required(f):
     """Декоратор для проверки прав преподавателя"""
     from functools import wraps
@@ -92,10 +281,113 @@ def teacher_required(f):
     return decorated_function
 
 
+# Поля списка курсов (?fields=...) и их колонки в БД; creator берется из Auth Service
+COURSE_FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'description': ('description',),
+    'creator_id': ('creator_id',),
+    'creator': ('creator_id',),
+    'created_at': ('created_at',),
+    'is_published': ('is_published',),
+    'banner_image': ('banner_image',),
+}
+# ?view=summary - карточки каталога без описания
+COURSE_SUMMARY_FIELDS = ['id', 'title', 'creator_id', 'creator', 'created_at', 'is_published', 'banner_image']
+
+
+def parse_fields(allowed, summary):
+    """Список полей ответа из ?fields=a,b или ?view=summary|full (по умолчанию full)"""
+    fields = request.args.get('fields')
+    if fields:
+        requested = {field.strip() for field in fields.split(',') if field.strip()}
+        unknown = requested - set(allowed)
+        if unknown:
+            raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+        requested.add('id')
+        return [field for field in allowed if field in requested]
+    
+    view = request.args.get('view', 'full')
+    if view == 'full':
+        return list(allowed)
+    if view == 'summary':
+        return list(summary)
+    raise ValueError('Параметр view должен быть summary или full')
+
+
+def parse_ids(value, max_ids):
+    """Список id из строки '1,2,3' (для пакетных запросов)"""
+    try:
+        ids = {int(item) for item in value.split(',') if item.strip()}
+    except ValueError:
+        raise ValueError('Параметр ids должен быть списком чисел через запятую')
+    if len(ids) > max_ids:
+        raise ValueError(f'Не больше {max_ids} id в одном запросе')
+    return sorted(ids)
+
+
+def parse_page_args():
+    """Параметры пагинации запроса с лимитами из конфигурации"""
+    return parse_page(request.args, app.config['PAGE_SIZE_DEFAULT'], app.config['PAGE_SIZE_MAX'])
+
+
+def load_fields(model, field_columns, fields):
+    """Опция запроса, загружающая из БД только колонки запрошенных полей"""
+    columns = {column for field in fields for column in field_columns[field]}
+    return load_only(*[getattr(model, column) for column in sorted(columns)])
+
+
+def course_to_dict(course, fields, creators_info=None):
+    """Сериализовать курс, обращаясь только к запрошенным (загруженным) полям"""
+    data = {}
+    for field in fields:
+        if field == 'creator':
+            data[field] = (creators_info or {}).get(course.creator_id, 'Неизвестно')
+        elif field == 'created_at':
+            data[field] = course.created_at.isoformat()
+        else:
+            data[field] = getattr(course, field)
+    return data
+
+
+def store_banner(data):
+    """Сохранить баннер (base64 или data: URL) в хранилище блобов и вернуть его SHA-256"""
+    if not data:
+        return None
+    if blob_store.is_digest(data) and ImageBlob.query.get(data):
+        return data  # Уже загруженный баннер
+    content_type, raw = decode_image(data)
+    digest = blob_store.put(raw)
+    if not ImageBlob.query.get(digest):
+        db.session.add(ImageBlob(digest=digest, content_type=content_type, size=len(raw)))
+    return digest
+
+
+def migrate_inline_banners():
+    """Перенести base64 баннеры, хранившиеся прямо в Course.banner_image, в хранилище блобов"""
+    # Перенесенный баннер - SHA-256 в hex; длина строки этого не гарантирует
+    pending = [
+        course_id for course_id, banner in db.session.query(Course.id, Course.banner_image).filter(
+            Course.banner_image.isnot(None), Course.banner_image != ''
+        ) if not blob_store.is_digest(banner)
+    ]
+    migrated = 0
+    for course in Course.query.filter(Course.id.in_(pending)).all() if pending else []:
+        try:
+            course.banner_image = store_banner(course.banner_image)
+            migrated += 1
+        except ValueError as e:
+            print(f"Course {course.id}: banner not migrated: {e}")
+    if migrated:
+        db.session.commit()
+        print(f"Moved inline banners of {migrated} courses to blob store")
+
+
 def init_db():
     """Инициализация базы данных"""
     with app.app_context():
-        db.create_all()
+        init_schema(db)
+        migrate_inline_banners()
 
 
 @app.route('/health', methods=['GET'])
@@ -104,53 +396,111 @@ def health():
     return jsonify({'status': 'healthy', 'service': 'course-service'}), 200
 
 
+@app.route('/token-cache/stats', methods=['GET'])
+def token_cache_stats():
+    """Статистика кэша валидации токенов"""
+    return jsonify({
+        'local_jwt_verify': app.config['LOCAL_JWT_VERIFY'],
+        'cache': token_cache.stats(),
+        'revocations': token_verifier.revocations.stats()
+    }), 200
+
+
+@app.route('/http-pool/stats', methods=['GET'])
+def http_pool_stats():
+    """Статистика пулов соединений к другим сервисам"""
+    return jsonify(http_client.stats()), 200
+
+
+@app.route('/user-name-cache/stats', methods=['GET'])
+def user_name_cache_stats():
+    """Статистика кэша имен пользователей"""
+    return jsonify(user_names.stats()), 200
+
+
 @app.route('/courses', methods=['GET'])
 def get_courses():
-    """Получить список всех опубликованных курсов"""
-    courses = Course.query.filter_by(is_published=True).all()
+    """Получить список всех опубликованных курсов (?fields= / ?view=summary, ?ids=1,2,3 - пакетно по id, ?limit=&after=)"""
+    try:
+        fields = parse_fields(list(COURSE_FIELDS), COURSE_SUMMARY_FIELDS)
+        ids = parse_ids(request.args['ids'], app.config['COURSE_BATCH_MAX_IDS']) if 'ids' in request.args else None
+        page = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Получение информации о создателях через Auth Service
-    creator_ids = [course.creator_id for course in courses]
-    creators_info = {}
+    query = Course.query.options(load_fields(Course, COURSE_FIELDS, fields)).filter_by(is_published=True)
+    if ids is not None:
+        # Один запрос с IN вместо отдельного GET /courses/<id> на каждый курс
+        query = query.filter(Course.id.in_(ids))
+    if page:
+        courses, next_after = fetch_page(query, [Course.id], page)
+    else:
+        courses = query.all()
     
-    if creator_ids:
-        try:
-            response = requests.get(
-                f"{app.config['AUTH_SERVICE_URL']}/users",
-                timeout=2
-            )
-            if response.status_code == 200:
-                users = response.json()
-                creators_info = {u['id']: u['username'] for u in users}
-        except:
-            pass
+    # Имена создателей: из кэша, недостающие - одним пакетным запросом к Auth Service
+    creators_info = user_names.get_many([course.creator_id for course in courses]) if 'creator' in fields else {}
     
-    return jsonify([{
-        'id': course.id,
-        'title': course.title,
-        'description': course.description,
-        'creator_id': course.creator_id,
-        'creator': creators_info.get(course.creator_id, 'Неизвестно'),
-        'created_at': course.created_at.isoformat(),
-        'is_published': course.is_published,
-        'banner_image': course.banner_image
-    } for course in courses]), 200
+    items = [course_to_dict(course, fields, creators_info) for course in courses]
+    if page:
+        return jsonify({'items': items, 'next_after': next_after}), 200
+    return jsonify(items), 200
+
+
+@app.route('/courses/search', methods=['GET'])
+def search_courses():
+    """Поиск опубликованных курсов по названию и описанию (?q=, ?fields= / ?view=summary, ?limit=&after=)"""
+    try:
+        fields = parse_fields(list(COURSE_FIELDS), COURSE_SUMMARY_FIELDS)
+        expression, limit, offset = parse_search(request.args, app.config['SEARCH_PAGE_SIZE'], app.config['PAGE_SIZE_MAX'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 501, а не 503: отсутствие FTS5 - не сбой сервиса, circuit breaker gateway его не считает
+    if not course_search.available(db.session):
+        return jsonify({'error': 'Поиск недоступен'}), 501
+    
+    rows, next_after = course_search.search(
+        db.session, expression, limit, offset, 'description', where='t.is_published = 1'
+    )
+    ids = [row.id for row in rows]
+    courses = {
+        course.id: course for course in
+        Course.query.options(load_fields(Course, COURSE_FIELDS, fields)).filter(Course.id.in_(ids))
+    } if ids else {}
+    creators_info = user_names.get_many([course.creator_id for course in courses.values()]) if 'creator' in fields else {}
+    
+    items = []
+    for row in rows:
+        if row.id in courses:
+            item = course_to_dict(courses[row.id], fields, creators_info)
+            item['snippet'] = row.snippet
+            items.append(item)
+    return jsonify({'items': items, 'next_after': next_after}), 200
 
 
 @app.route('/courses/my', methods=['GET'])
 @login_required
 def get_my_courses(current_user=None):
-    """Получить курсы текущего пользователя"""
+    """Получить курсы текущего пользователя (?limit=&after=)"""
     user_id = current_user['id']
     role = current_user['role']
+    try:
+        page = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
+    next_after = None
     if role in ['teacher', 'admin']:
-        courses = Course.query.filter_by(creator_id=user_id).all()
+        query = Course.query.filter_by(creator_id=user_id)
+        if page:
+            courses, next_after = fetch_page(query, [Course.id], page)
+        else:
+            courses = query.all()
     else:
         # Для студентов нужно получить через Learning Service
         courses = []
     
-    return jsonify([{
+    items = [{
         'id': course.id,
         'title': course.title,
         'description': course.description,
@@ -158,7 +508,10 @@ def get_my_courses(current_user=None):
         'created_at': course.created_at.isoformat(),
         'is_published': course.is_published,
         'banner_image': course.banner_image
-    } for course in courses]), 200
+    } for course in courses]
+    if page:
+        return jsonify({'items': items, 'next_after': next_after}), 200
+    return jsonify(items), 200
 
 
 @app.route('/courses', methods=['POST'])
@@ -173,7 +526,10 @@ def create_course(current_user=None):
         is_published=data.get('is_published', True)  # По умолчанию публикуется
     )
     db.session.add(course)
+    db.session.flush()
+    record_course_change(course.id)
     db.session.commit()
+    notify_course_changed(course.id)
     
     return jsonify({
         'id': course.id,
@@ -204,16 +560,7 @@ def get_course(course_id):
             return jsonify({'error': 'Курс не опубликован'}), 403
     
     # Получение информации о создателе
-    creator_name = 'Неизвестно'
-    try:
-        response = requests.get(
-            f"{app.config['AUTH_SERVICE_URL']}/user/{course.creator_id}",
-            timeout=2
-        )
-        if response.status_code == 200:
-            creator_name = response.json().get('username', 'Неизвестно')
-    except:
-        pass
+    creator_name = user_names.get(course.creator_id) or 'Неизвестно'
     
     return jsonify({
         'id': course.id,
@@ -227,6 +574,41 @@ def get_course(course_id):
     }), 200
 
 
+@app.route('/courses/<int:course_id>/meta', methods=['GET'])
+@internal_required
+def get_course_meta(course_id):
+    """Создатель и флаг публикации курса (для проверок прав в других сервисах)"""
+    course = Course.query.options(load_only(Course.id, Course.creator_id, Course.is_published)).get_or_404(course_id)
+    return jsonify({
+        'id': course.id,
+        'creator_id': course.creator_id,
+        'is_published': course.is_published
+    }), 200
+
+
+@app.route('/course-changes', methods=['GET'])
+@internal_required
+def get_course_changes():
+    """Id курсов, измененных после записи журнала since (для сброса кэшей в других сервисах)
+
+    Без since - только текущая позиция журнала. reset=true: since вне журнала
+    (старые записи удалены или БД пересоздана), кэш нужно сбросить целиком.
+    """
+    since = request.args.get('since', type=int)
+    first_id, last_id = db.session.query(db.func.min(CourseChange.id), db.func.max(CourseChange.id)).one()
+    last_id = last_id or 0
+    if since is None or since > last_id or (first_id is not None and since < first_id - 1):
+        return jsonify({'course_ids': [], 'last_id': last_id, 'reset': since is not None, 'more': False}), 200
+    
+    changes = CourseChange.query.filter(CourseChange.id > since).order_by(CourseChange.id).limit(COURSE_CHANGES_PAGE_SIZE).all()
+    return jsonify({
+        'course_ids': sorted({change.course_id for change in changes}),
+        'last_id': changes[-1].id if changes else since,
+        'reset': False,
+        'more': len(changes) == COURSE_CHANGES_PAGE_SIZE
+    }), 200
+
+
 @app.route('/courses/<int:course_id>', methods=['PUT'])
 @teacher_required
 def update_course(course_id, current_user=None):
@@ -244,9 +626,14 @@ def update_course(course_id, current_user=None):
     if 'is_published' in data:
         course.is_published = data['is_published']
     if 'banner_image' in data:
-        course.banner_image = data['banner_image']
+        try:
+            course.banner_image = store_banner(data['banner_image'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
+    record_course_change(course.id)
     db.session.commit()
+    notify_course_changed(course.id)
     
     return jsonify({
         'id': course.id,
@@ -257,6 +644,16 @@ def update_course(course_id, current_user=None):
     }), 200
 
 
+@app.route('/banners/<digest>', methods=['GET'])
+def get_banner(digest):
+    """Получить баннер курса (strong ETag, 304, Range, sendfile)"""
+    blob = ImageBlob.query.get(digest) if blob_store.is_digest(digest) else None
+    if not blob or not blob_store.exists(digest):
+        return jsonify({'error': 'Баннер не найден'}), 404
+    
+    return send_blob(blob_store, digest, blob.content_type)
+
+
 @app.route('/courses/<int:course_id>', methods=['DELETE'])
 @teacher_required
 def delete_course(course_id, current_user=None):
@@ -267,7 +664,9 @@ def delete_course(course_id, current_user=None):
         return jsonify({'error': 'У вас нет прав на удаление этого курса'}), 403
     
     db.session.delete(course)
+    record_course_change(course_id)
     db.session.commit()
+    notify_course_changed(course_id)
     
     return jsonify({'message': 'Курс успешно удален'}), 200
 
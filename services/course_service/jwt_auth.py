@@ -0,0 +1,161 @@
+"""
+Локальная проверка JWT токенов без обращения к Auth Service на каждый запрос
+
+Подпись HS256 и срок действия проверяются в процессе с тем же секретом, что
+использует Auth Service (JWT_SECRET_FILE / JWT_SECRET). Отзыв токенов
+(удаление пользователя, смена роли, выход) приходит из Auth Service через
+периодический опрос /revocations в фоновом потоке.
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+import jwt
+import requests
+
+# Совпадает с размером страницы /revocations в Auth Service
+REVOCATIONS_PAGE_SIZE = 1000
+# Заголовок с токеном межсервисных вызовов (gateway его не передает)
+INTERNAL_TOKEN_HEADER = 'X-Internal-Token'
+
+
+def load_jwt_secret():
+    """Прочитать секрет JWT: Docker secret из файла или переменная окружения"""
+    secret_file = os.environ.get('JWT_SECRET_FILE')
+    if secret_file and os.path.exists(secret_file):
+        with open(secret_file, 'r') as f:
+            return f.read().strip()
+    return os.environ.get('JWT_SECRET', 'jwt-secret-key-change-in-production')
+
+
+def load_internal_token(jwt_secret):
+    """Токен внутренних эндпоинтов (метаданные и журнал изменений курсов, сброс кэша)
+
+    INTERNAL_SERVICE_TOKEN_FILE / INTERNAL_SERVICE_TOKEN, по умолчанию -
+    HMAC от секрета JWT, который у сервисов уже общий: отдельный секрет не
+    нужен, а сам секрет JWT по сети не передается.
+    """
+    token_file = os.environ.get('INTERNAL_SERVICE_TOKEN_FILE')
+    if token_file and os.path.exists(token_file):
+        with open(token_file, 'r') as f:
+            return f.read().strip()
+    token = os.environ.get('INTERNAL_SERVICE_TOKEN')
+    if token:
+        return token
+    return hmac.new(jwt_secret.encode(), b'internal-service-token', hashlib.sha256).hexdigest()
+
+
+def is_internal_request(headers, internal_token):
+    """Запрос пришел от другого сервиса платформы (совпал токен)"""
+    return hmac.compare_digest(headers.get(INTERNAL_TOKEN_HEADER, '').encode(), internal_token.encode())
+
+
+class RevocationList:
+    """Список отзывов токенов, синхронизируемый с Auth Service
+
+    Хранит для каждого пользователя момент отзыва: токены, выпущенные
+    не позже этого момента, считаются недействительными. iat и revoked_at -
+    Unix time с долями секунды, поэтому токен нового входа, выпущенный в ту
+    же секунду, что и отзыв, остается действительным.
+    """
+
+    def __init__(self, auth_service_url, poll_interval=30, http=None):
+        self.auth_service_url = auth_service_url
+        self.poll_interval = poll_interval
+        self.http = http or requests
+        self._revoked = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._synced = False
+
+    def start(self):
+        """Запустить фоновый опрос (лениво, при первой проверке токена)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.poll()
+            time.sleep(self.poll_interval)
+
+    def poll(self):
+        """Получить новые отзывы из Auth Service"""
+        while True:
+            try:
+                response = self.http.get(
+                    f"{self.auth_service_url}/revocations",
+                    params={'since': self._last_id},
+                    timeout=2
+                )
+                if response.status_code != 200:
+                    return False
+                data = response.json()
+            except Exception as e:
+                print(f"Revocation poll failed: {e}")
+                return False
+
+            revocations = data.get('revocations', [])
+            with self._lock:
+                for item in revocations:
+                    user_id = item['user_id']
+                    revoked_at = item['revoked_at']
+                    if revoked_at > self._revoked.get(user_id, 0):
+                        self._revoked[user_id] = revoked_at
+                self._last_id = max(self._last_id, data.get('last_id', self._last_id))
+                self._synced = True
+
+            # Auth Service отдает отзывы страницами, догоняем до конца
+            if len(revocations) < REVOCATIONS_PAGE_SIZE:
+                return True
+
+    def is_revoked(self, user_id, issued_at):
+        """Проверить, отозван ли токен пользователя, выпущенный в issued_at"""
+        revoked_at = self._revoked.get(user_id)
+        if revoked_at is None:
+            return False
+        # Токены без iat (выпущенные до введения отзывов) считаем отозванными
+        return issued_at is None or issued_at <= revoked_at
+
+    def stats(self):
+        """Состояние синхронизации для диагностики"""
+        return {
+            'revoked_users': len(self._revoked),
+            'last_id': self._last_id,
+            'synced': self._synced,
+            'poll_interval': self.poll_interval
+        }
+
+
+class LocalTokenVerifier:
+    """Проверка JWT токенов в процессе"""
+
+    def __init__(self, secret, auth_service_url, poll_interval=30, http=None):
+        self.secret = secret
+        self.revocations = RevocationList(auth_service_url, poll_interval, http)
+
+    def verify(self, token):
+        """Вернуть пользователя из токена или None, если токен недействителен"""
+        self.revocations.start()
+        try:
+            payload = jwt.decode(
+                token, self.secret, algorithms=['HS256'],
+                options={'require': ['exp', 'user_id']}
+            )
+        except jwt.InvalidTokenError:
+            return None
+
+        if self.revocations.is_revoked(payload['user_id'], payload.get('iat')):
+            return None
+
+        return {
+            'id': payload['user_id'],
+            'username': payload.get('username'),
+            'role': payload.get('role', 'student')
+        }
@@ -0,0 +1,83 @@
+"""
+Кэш имен пользователей (id -> username) для Course Service
+
+Имена создателей курсов догружаются из Auth Service одним пакетным
+запросом POST /users/batch только для id, которых нет в кэше, вместо
+выгрузки всей таблицы /users на каждый запрос каталога. Отсутствующие
+пользователи тоже кэшируются (как None), чтобы не запрашивать их снова.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserNameCache:
+    """Потокобезопасный LRU кэш имен пользователей с TTL"""
+
+    def __init__(self, fetch, max_size=10000, ttl=300):
+        # fetch(ids) -> {id: username} или None, если Auth Service недоступен
+        self.fetch = fetch
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.evictions = 0
+
+    def get_many(self, user_ids):
+        """Имена для списка id: из кэша, недостающие - одним запросом"""
+        now = time.time()
+        result = {}
+        missing = []
+        with self._lock:
+            for user_id in set(user_ids):
+                entry = self._entries.get(user_id)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(user_id)
+                    result[user_id] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.append(user_id)
+                    self.misses += 1
+
+        if missing:
+            self.fetches += 1
+            fetched = self.fetch(sorted(missing))
+            if fetched is not None:
+                expires_at = time.time() + self.ttl
+                with self._lock:
+                    for user_id in missing:
+                        self._entries[user_id] = (fetched.get(user_id), expires_at)
+                        self._entries.move_to_end(user_id)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+                result.update({user_id: fetched.get(user_id) for user_id in missing})
+
+        return {user_id: name for user_id, name in result.items() if name is not None}
+
+    def get(self, user_id):
+        """Имя одного пользователя или None"""
+        return self.get_many([user_id]).get(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Счетчики для диагностики"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'fetches': self.fetches,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -5,10 +5,14 @@ Frontend Service - Веб-интерфейс приложения
 from flask import Flask, render_template
 from flask_cors import CORS
 import os
+from metrics import init_metrics
 
 app = Flask(__name__)
 CORS(app)
 
+# Метрики Prometheus (GET /metrics)
+init_metrics(app)
+
 # URL API Gateway для клиентской части
 API_GATEWAY_URL = os.environ.get('API_GATEWAY_URL', 'http://localhost:5000')
 
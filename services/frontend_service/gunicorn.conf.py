@@ -0,0 +1,42 @@
+"""
+Настройки gunicorn для продакшен запуска Frontend Service
+
+Pre-fork: master процесс запускает GUNICORN_WORKERS воркеров по
+GUNICORN_THREADS потоков. SIGHUP - плавный перезапуск воркеров.
+"""
+
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+wsgi_app = 'app:app'
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+
+# Метрики Prometheus со всех воркеров: prometheus_client пишет значения в файлы
+# этого каталога (multiprocess режим), GET /metrics любого воркера их суммирует
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus-metrics'))
+
+
+def reset_metrics_dir():
+    """Пустой каталог метрик при старте (значения прошлого запуска не учитываются)"""
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def on_starting(server):
+    reset_metrics_dir()
+
+
+def child_exit(server, worker):
+    """Значения gauge завершившегося воркера больше не учитываются"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -4,10 +4,24 @@ Learning Service - Микросервис управления уроками и
 
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import load_only
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
+import re
 import requests
-import base64
+from jwt_auth import INTERNAL_TOKEN_HEADER, LocalTokenVerifier, is_internal_request, load_internal_token, load_jwt_secret
+from token_cache import MISS, TokenCache
+from http_client import PooledHttpClient
+from metrics import init_metrics, observe_upstream
+from blob_store import BlobStore, decode_image, send_blob
+from pagination import parse_page, fetch_page
+from migrations import LESSON_SEARCH, init_schema
+from course_cache import CourseChangeFeed, CourseMetaCache
+from progress_counters import PROGRESS_SQL, recompute, recount_user
+from search_index import parse_search
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import IntegrityError
 import json
 
 app = Flask(__name__)
@@ -22,9 +36,127 @@ else:
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['AUTH_SERVICE_URL'] = os.environ.get('AUTH_SERVICE_URL', 'http://localhost:5001')
 app.config['COURSE_SERVICE_URL'] = os.environ.get('COURSE_SERVICE_URL', 'http://localhost:5002')
+# Локальная проверка JWT (без запроса к Auth Service /validate на каждый вызов)
+app.config['LOCAL_JWT_VERIFY'] = os.environ.get('LOCAL_JWT_VERIFY', 'true').lower() in ('1', 'true', 'yes')
+app.config['JWT_REVOCATION_POLL_INTERVAL'] = int(os.environ.get('JWT_REVOCATION_POLL_INTERVAL', 30))
+# Кэш удаленной валидации токенов (используется при LOCAL_JWT_VERIFY=false)
+app.config['TOKEN_CACHE_SIZE'] = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+app.config['TOKEN_CACHE_TTL'] = int(os.environ.get('TOKEN_CACHE_TTL', 60))
+app.config['TOKEN_CACHE_NEGATIVE_TTL'] = int(os.environ.get('TOKEN_CACHE_NEGATIVE_TTL', 5))
+# Пакетное получение курсов: id в одном запросе к Course Service (не больше его
+# COURSE_BATCH_MAX_IDS) и число параллельных запросов, если id больше
+app.config['COURSE_BATCH_SIZE'] = int(os.environ.get('COURSE_BATCH_SIZE', 100))
+app.config['COURSE_BATCH_CONCURRENCY'] = int(os.environ.get('COURSE_BATCH_CONCURRENCY', 4))
+# Кэш метаданных курсов (создатель, публикация) для проверок прав; Course Service
+# сбрасывает записи уведомлением POST /course-cache/invalidate (один воркер), а
+# каждый воркер раз в COURSE_CHANGE_POLL_INTERVAL секунд читает журнал /course-changes
+app.config['COURSE_CACHE_SIZE'] = int(os.environ.get('COURSE_CACHE_SIZE', 10000))
+app.config['COURSE_CACHE_TTL'] = int(os.environ.get('COURSE_CACHE_TTL', 30))
+app.config['COURSE_CACHE_NEGATIVE_TTL'] = int(os.environ.get('COURSE_CACHE_NEGATIVE_TTL', 5))
+app.config['COURSE_CHANGE_POLL_INTERVAL'] = float(os.environ.get('COURSE_CHANGE_POLL_INTERVAL', 2))
+# Keyset пагинация списков (?limit=&after=): размер страницы по умолчанию и максимум
+app.config['PAGE_SIZE_DEFAULT'] = int(os.environ.get('PAGE_SIZE_DEFAULT', 50))
+app.config['PAGE_SIZE_MAX'] = int(os.environ.get('PAGE_SIZE_MAX', 500))
+# Результатов поиска на странице по умолчанию (GET /lessons/search)
+app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+# Сколько найденных уроков проверяется на доступ за один запрос поиска (не администратор)
+app.config['SEARCH_SCAN_MAX'] = int(os.environ.get('SEARCH_SCAN_MAX', 1000))
+# Пакетная отметка уроков (POST /progress/batch): максимум уроков в одном запросе
+app.config['PROGRESS_BATCH_MAX'] = int(os.environ.get('PROGRESS_BATCH_MAX', 1000))
+# Хранилище изображений уроков (сырые байты, адресация по SHA-256)
+app.config['BLOB_STORE_DIR'] = os.environ.get(
+    'BLOB_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'blobs')
+)
+# X-Sendfile: отдачу файлов изображений берет на себя фронтовой веб-сервер (nginx и т.п.)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() in ('1', 'true', 'yes')
 
 db = SQLAlchemy(app)
 
+# Общий пул keep-alive соединений для запросов к другим сервисам
+http_client = PooledHttpClient.from_env()
+
+# Метрики Prometheus (GET /metrics): маршруты, SQL запросы, вызовы других сервисов
+init_metrics(app, db)
+http_client.observer = observe_upstream
+
+jwt_secret = load_jwt_secret()
+# Токен вызовов между сервисами (/courses/<id>/meta, /course-changes, /course-cache/invalidate)
+internal_token = load_internal_token(jwt_secret)
+token_verifier = LocalTokenVerifier(
+    jwt_secret,
+    app.config['AUTH_SERVICE_URL'],
+    app.config['JWT_REVOCATION_POLL_INTERVAL'],
+    http_client
+)
+token_cache = TokenCache(
+    app.config['TOKEN_CACHE_SIZE'],
+    app.config['TOKEN_CACHE_TTL'],
+    app.config['TOKEN_CACHE_NEGATIVE_TTL']
+)
+blob_store = BlobStore(app.config['BLOB_STORE_DIR'])
+
+
+def fetch_course_meta(course_id):
+    """Создатель и флаг публикации курса из Course Service (None - курса нет)"""
+    response = http_client.get(
+        f"{app.config['COURSE_SERVICE_URL']}/courses/{course_id}/meta",
+        headers={INTERNAL_TOKEN_HEADER: internal_token},
+        timeout=2
+    )
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise RuntimeError(f"Course meta lookup failed: {response.status_code}")
+    data = response.json()
+    return {'creator_id': data['creator_id'], 'is_published': data['is_published']}
+
+
+course_cache = CourseMetaCache(
+    fetch_course_meta,
+    app.config['COURSE_CACHE_SIZE'],
+    app.config['COURSE_CACHE_TTL'],
+    app.config['COURSE_CACHE_NEGATIVE_TTL']
+)
+
+
+def fetch_course_changes(since):
+    """Страница журнала изменений курсов из Course Service"""
+    response = http_client.get(
+        f"{app.config['COURSE_SERVICE_URL']}/course-changes",
+        params={} if since is None else {'since': since},
+        headers={INTERNAL_TOKEN_HEADER: internal_token},
+        timeout=2
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Course changes lookup failed: {response.status_code}")
+    return response.json()
+
+
+course_changes = CourseChangeFeed(course_cache, fetch_course_changes, app.config['COURSE_CHANGE_POLL_INTERVAL'])
+
+
+def get_course_meta(course_id):
+    """Метаданные курса из кэша (None - курса нет); запускает опрос журнала изменений"""
+    course_changes.start()
+    return course_cache.get(course_id)
+
+
+def lesson_access(user):
+    """Проверка строки поиска: урок опубликованного или своего курса (курс проверяется один раз)"""
+    access = {}
+    
+    def accept(row):
+        if row.course_id not in access:
+            course = get_course_meta(row.course_id)
+            access[row.course_id] = course is not None and (
+                course['is_published'] or course['creator_id'] == user['id']
+            )
+        return access[row.course_id]
+    return accept
+
+
+course_batch_pool = ThreadPoolExecutor(max_workers=app.config['COURSE_BATCH_CONCURRENCY'])
+
 
 class Lesson(db.Model):
     """Модель урока"""
@@ -32,10 +164,13 @@ class Lesson(db.Model):
     course_id = db.Column(db.Integer, nullable=False)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text)
-    images = db.Column(db.Text)  # JSON список изображений (base64 или URL)
+    images = db.Column(db.Text)  # JSON список ссылок на изображения ({"id": sha256} или {"url": ...})
     order = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Уроки курса всегда выбираются по course_id с сортировкой по order
+    __table_args__ = (db.Index('ix_lesson_course_order', 'course_id', 'order'),)
+    
     def get_images(self):
         """Получить список изображений"""
         if self.images:
@@ -50,6 +185,19 @@ class Lesson(db.Model):
         self.images = json.dumps(images_list) if images_list else None
 
 
+# Полнотекстовый индекс уроков (migrations.py); в новой БД создается вместе с таблицей lesson
+lesson_search = LESSON_SEARCH
+lesson_search.attach(Lesson.__table__)
+
+
+class ImageBlob(db.Model):
+    """Метаданные изображения из хранилища блобов (сами байты лежат на диске)"""
+    digest = db.Column(db.String(64), primary_key=True)  # SHA-256 содержимого
+    content_type = db.Column(db.String(100), nullable=False, default='image/png')
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class Enrollment(db.Model):
     """Модель записи на курс"""
     id = db.Column(db.Integer, primary_key=True)
@@ -57,8 +205,20 @@ class Enrollment(db.Model):
     course_id = db.Column(db.Integer, nullable=False)
     enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
     progress = db.Column(db.Integer, default=0)
+    # Счетчики для расчета progress без подсчета уроков и отметок на каждое прохождение
+    total_lessons = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_lessons = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'course_id', name='unique_enrollment'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'course_id', name='unique_enrollment'),
+        db.Index('ix_enrollment_course_id', 'course_id'),
+    )
+
+
+class CourseStats(db.Model):
+    """Число уроков курса (обновляется при создании и удалении уроков)"""
+    course_id = db.Column(db.Integer, primary_key=True)
+    lesson_count = db.Column(db.Integer, nullable=False, default=0)
 
 
 class LessonProgress(db.Model):
@@ -68,19 +228,38 @@ class LessonProgress(db.Model):
     lesson_id = db.Column(db.Integer, nullable=False)
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'lesson_id', name='unique_lesson_progress'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'lesson_id', name='unique_lesson_progress'),
+        db.Index('ix_lesson_progress_lesson_id', 'lesson_id'),
+    )
 
 
 def validate_token(token):
-    """Валидация токена через Auth Service"""
+    """Валидация токена: локально по подписи или через Auth Service"""
+    if app.config['LOCAL_JWT_VERIFY']:
+        return token_verifier.verify(token)
+    return validate_token_remote(token)
+
+
+def validate_token_remote(token):
+    """Валидация токена через Auth Service (с кэшированием результата)"""
+    cached = token_cache.get(token)
+    if cached is not MISS:
+        return cached
+    
     try:
-        response = requests.post(
+        response = http_client.post(
             f"{app.config['AUTH_SERVICE_URL']}/validate",
             json={'token': token},
             timeout=2
         )
         if response.status_code == 200:
-            return response.json().get('user')
+            user = response.json().get('user')
+            token_cache.put(token, user)
+            return user
+        # Кэшируем только явный отказ Auth Service, а не сбои связи
+        if response.status_code in (400, 401, 404):
+            token_cache.put_negative(token)
         return None
     except:
         return None
@@ -110,6 +289,17 @@ def login_required(f):
     return decorated_function
 
 
+def internal_required(f):
+    """Декоратор для эндпоинтов, которые вызывают только другие сервисы"""
+    from functools import wraps
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_internal_request(request.headers, internal_token):
+            return jsonify({'error': 'Доступ запрещен'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 def teacher_required(f):
     """Декоратор для проверки прав преподавателя"""
     from functools import wraps
@@ -128,10 +318,183 @@ def teacher_required(f):
     return decorated_function
 
 
+# Поля списка уроков (?fields=...) и их колонки в БД
+LESSON_FIELDS = {
+    'id': ('id',),
+    'course_id': ('course_id',),
+    'title': ('title',),
+    'content': ('content',),
+    'images': ('images',),
+    'order': ('order',),
+    'created_at': ('created_at',),
+}
+# ?view=summary - оглавление курса без текста и изображений уроков
+LESSON_SUMMARY_FIELDS = ['id', 'course_id', 'title', 'order', 'created_at']
+
+
+def parse_fields(allowed, summary):
+    """Список полей ответа из ?fields=a,b или ?view=summary|full (по умолчанию full)"""
+    fields = request.args.get('fields')
+    if fields:
+        requested = {field.strip() for field in fields.split(',') if field.strip()}
+        unknown = requested - set(allowed)
+        if unknown:
+            raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+        requested.add('id')
+        return [field for field in allowed if field in requested]
+    
+    view = request.args.get('view', 'full')
+    if view == 'full':
+        return list(allowed)
+    if view == 'summary':
+        return list(summary)
+    raise ValueError('Параметр view должен быть summary или full')
+
+
+def parse_page_args(cursor_size=1):
+    """Параметры пагинации запроса с лимитами из конфигурации"""
+    return parse_page(request.args, app.config['PAGE_SIZE_DEFAULT'], app.config['PAGE_SIZE_MAX'], cursor_size)
+
+
+def load_fields(model, field_columns, fields, extra=()):
+    """Опция запроса, загружающая из БД только колонки запрошенных полей (и extra)"""
+    columns = {column for field in fields for column in field_columns[field]} | set(extra)
+    return load_only(*[getattr(model, column) for column in sorted(columns)])
+
+
+def lesson_to_dict(lesson, fields):
+    """Сериализовать урок, обращаясь только к запрошенным (загруженным) полям"""
+    data = {}
+    for field in fields:
+        if field == 'images':
+            data[field] = lesson.get_images()
+        elif field == 'created_at':
+            data[field] = lesson.created_at.isoformat()
+        else:
+            data[field] = getattr(lesson, field)
+    return data
+
+
+def fetch_courses(course_ids, fields):
+    """Опубликованные курсы по списку id: пакетные GET /courses?ids=... вместо запроса на каждый курс
+
+    Если хотя бы один пакет не получен, бросает исключение (RuntimeError или
+    requests.RequestException): молча потерять часть записей хуже, чем ошибка.
+    """
+    ids = sorted(set(course_ids))
+    size = app.config['COURSE_BATCH_SIZE']
+    chunks = [ids[i:i + size] for i in range(0, len(ids), size)]
+    
+    def fetch_chunk(chunk):
+        response = http_client.get(
+            f"{app.config['COURSE_SERVICE_URL']}/courses",
+            params={'ids': ','.join(map(str, chunk)), 'fields': ','.join(fields)},
+            timeout=2
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Course batch lookup failed: {response.status_code}")
+        return response.json()
+    
+    if len(chunks) > 1:
+        results = list(course_batch_pool.map(fetch_chunk, chunks))
+    else:
+        results = [fetch_chunk(chunk) for chunk in chunks]
+    return {course['id']: course for result in results for course in result}
+
+
+def store_image(data, content_type='image/png'):
+    """Сохранить base64 изображение в хранилище блобов и вернуть ссылку на него"""
+    content_type, raw = decode_image(data, content_type)
+    digest = blob_store.put(raw)
+    if not ImageBlob.query.get(digest):
+        db.session.add(ImageBlob(digest=digest, content_type=content_type, size=len(raw)))
+    return {'id': digest, 'type': content_type, 'size': len(raw)}
+
+
+# Внешние изображения: только http(s) (и blob: из браузера), без кавычек, пробелов и
+# угловых скобок - javascript: и разрыв атрибута в разметке не пропускаются
+IMAGE_URL_RE = re.compile(r'^(https?|blob):[^\s"\'<>`]+$', re.IGNORECASE)
+
+
+def image_url(value):
+    """Проверенный URL внешнего изображения"""
+    if not isinstance(value, str) or not IMAGE_URL_RE.match(value):
+        raise ValueError('Недопустимый URL изображения (разрешены только http и https)')
+    return value
+
+
+def process_images(images):
+    """Привести изображения из запроса к ссылкам: base64 уходит в хранилище блобов"""
+    processed_images = []
+    for img in images:
+        if isinstance(img, dict):
+            blob = ImageBlob.query.get(img['id']) if blob_store.is_digest(img.get('id')) else None
+            # Формат: {"data": "base64...", "type": "image/png", "name": "image.png"}
+            if img.get('data'):
+                ref = store_image(img['data'], img.get('type') or 'image/png')
+            elif blob:
+                # Ссылка на уже загруженное изображение (например, при обновлении урока)
+                ref = {'id': blob.digest, 'type': blob.content_type, 'size': blob.size}
+            elif img.get('url'):
+                ref = {'url': image_url(img['url'])}
+            else:
+                continue
+            if img.get('name'):
+                ref['name'] = img['name']
+            processed_images.append(ref)
+        elif isinstance(img, str):
+            if img.startswith('http://') or img.startswith('https://'):
+                processed_images.append({'url': image_url(img)})
+            else:
+                # Просто base64 строка
+                processed_images.append(store_image(img))
+    return processed_images
+
+
+def migrate_inline_images():
+    """Перенести base64 изображения, хранившиеся прямо в Lesson.images, в хранилище блобов"""
+    migrated = 0
+    for lesson in Lesson.query.filter(Lesson.images.like('%"data"%')).all():
+        try:
+            lesson.set_images(process_images(lesson.get_images()))
+            migrated += 1
+        except ValueError as e:
+            print(f"Lesson {lesson.id}: images not migrated: {e}")
+    if migrated:
+        db.session.commit()
+        print(f"Moved inline images of {migrated} lessons to blob store")
+
+
+def course_lesson_count(course_id):
+    """Число уроков курса из course_stats"""
+    stats = CourseStats.query.get(course_id)
+    return stats.lesson_count if stats else 0
+
+
+def change_lesson_count(course_id, delta):
+    """Изменить число уроков курса и total_lessons всех записей на него (в текущей транзакции)"""
+    # Строка course_stats создается или обновляется одним upsert: параллельные первые уроки курса
+    # не конфликтуют на первичном ключе
+    db.session.execute(
+        text('INSERT INTO course_stats (course_id, lesson_count) VALUES (:course_id, :delta) '
+             'ON CONFLICT (course_id) DO UPDATE SET lesson_count = lesson_count + excluded.lesson_count'),
+        {'course_id': course_id, 'delta': delta}
+    )
+    db.session.execute(
+        text('UPDATE enrollment SET total_lessons = total_lessons + :delta WHERE course_id = :course_id'),
+        {'delta': delta, 'course_id': course_id}
+    )
+    db.session.execute(
+        text(f'UPDATE enrollment SET progress = {PROGRESS_SQL} WHERE course_id = :course_id'),
+        {'course_id': course_id}
+    )
+
+
 def init_db():
     """Инициализация базы данных"""
     with app.app_context():
-        db.create_all()
+        init_schema(db)
+        migrate_inline_images()
 
 
 @app.route('/health', methods=['GET'])
@@ -140,58 +503,136 @@ def health():
     return jsonify({'status': 'healthy', 'service': 'learning-service'}), 200
 
 
+@app.route('/token-cache/stats', methods=['GET'])
+def token_cache_stats():
+    """Статистика кэша валидации токенов"""
+    return jsonify({
+        'local_jwt_verify': app.config['LOCAL_JWT_VERIFY'],
+        'cache': token_cache.stats(),
+        'revocations': token_verifier.revocations.stats()
+    }), 200
+
+
+@app.route('/http-pool/stats', methods=['GET'])
+def http_pool_stats():
+    """Статистика пулов соединений к другим сервисам"""
+    return jsonify(http_client.stats()), 200
+
+
+@app.route('/course-cache/stats', methods=['GET'])
+def course_cache_stats():
+    """Статистика кэша метаданных курсов"""
+    stats = course_cache.stats()
+    stats['changes'] = course_changes.stats()
+    return jsonify(stats), 200
+
+
+@app.route('/course-cache/invalidate', methods=['POST'])
+@internal_required
+def invalidate_course_cache():
+    """Уведомление Course Service об изменении курса: сбросить его метаданные"""
+    course_id = (request.get_json(silent=True) or {}).get('course_id')
+    if not isinstance(course_id, int):
+        return jsonify({'error': 'Требуется course_id'}), 400
+    course_cache.invalidate(course_id)
+    return jsonify({'message': 'OK'}), 200
+
+
+@app.route('/lessons/search', methods=['GET'])
+@login_required
+def search_lessons(current_user=None):
+    """Поиск уроков по названию и тексту (?q=, ?course_id=, ?fields= / ?view=, по умолчанию summary, ?limit=&after=)
+
+    Администратор ищет по всем урокам, остальные - по урокам опубликованных
+    курсов и своих курсов. Публикация известна только Course Service, поэтому
+    курс каждого найденного урока проверяется по кэшу метаданных курсов, не
+    больше SEARCH_SCAN_MAX уроков за запрос.
+    """
+    try:
+        # Тексты уроков в выдаче поиска по умолчанию не нужны: есть snippet
+        fields = parse_fields(list(LESSON_FIELDS), LESSON_SUMMARY_FIELDS) \
+            if 'fields' in request.args or 'view' in request.args else list(LESSON_SUMMARY_FIELDS)
+        expression, limit, offset = parse_search(request.args, app.config['SEARCH_PAGE_SIZE'], app.config['PAGE_SIZE_MAX'])
+        course_id = request.args.get('course_id', type=int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 501, а не 503: отсутствие FTS5 - не сбой сервиса, circuit breaker gateway его не считает
+    if not lesson_search.available(db.session):
+        return jsonify({'error': 'Поиск недоступен'}), 501
+    
+    accept = None if current_user['role'] == 'admin' else lesson_access(current_user)
+    
+    try:
+        rows, next_after = lesson_search.search(
+            db.session, expression, limit, offset, 'content',
+            where='t.course_id = :course_id' if course_id is not None else None,
+            params={'course_id': course_id}, columns=('course_id',), accept=accept,
+            max_scan=app.config['SEARCH_SCAN_MAX']
+        )
+    except (RuntimeError, requests.RequestException) as e:
+        print(f"Lesson search failed: {e}")
+        return jsonify({'error': 'Ошибка связи с сервисом курсов'}), 500
+    ids = [row.id for row in rows]
+    lessons = {
+        lesson.id: lesson for lesson in
+        Lesson.query.options(load_fields(Lesson, LESSON_FIELDS, fields)).filter(Lesson.id.in_(ids))
+    } if ids else {}
+    
+    items = []
+    for row in rows:
+        if row.id in lessons:
+            item = lesson_to_dict(lessons[row.id], fields)
+            item['snippet'] = row.snippet
+            items.append(item)
+    return jsonify({'items': items, 'next_after': next_after}), 200
+
+
 @app.route('/courses/<int:course_id>/lessons', methods=['GET'])
 def get_lessons(course_id):
-    """Получить список уроков курса"""
-    lessons = Lesson.query.filter_by(course_id=course_id).order_by(Lesson.order).all()
+    """Получить список уроков курса (?fields= / ?view=summary, ?limit=&after=)"""
+    try:
+        fields = parse_fields(list(LESSON_FIELDS), LESSON_SUMMARY_FIELDS)
+        page = parse_page_args(cursor_size=2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify([{
-        'id': lesson.id,
-        'course_id': lesson.course_id,
-        'title': lesson.title,
-        'content': lesson.content,
-        'images': lesson.get_images(),
-        'order': lesson.order,
-        'created_at': lesson.created_at.isoformat()
-    } for lesson in lessons]), 200
+    # order нужен для курсора страницы, даже если поле не запрошено
+    query = Lesson.query.options(load_fields(Lesson, LESSON_FIELDS, fields, extra=('order',))).filter_by(course_id=course_id)
+    if not page:
+        lessons = query.order_by(Lesson.order).all()
+        return jsonify([lesson_to_dict(lesson, fields) for lesson in lessons]), 200
+    
+    lessons, next_after = fetch_page(query, [Lesson.order, Lesson.id], page)
+    return jsonify({'items': [lesson_to_dict(lesson, fields) for lesson in lessons], 'next_after': next_after}), 200
 
 
 @app.route('/courses/<int:course_id>/lessons', methods=['POST'])
 @teacher_required
 def create_lesson(course_id, current_user=None):
     """Создать урок в курсе"""
-    # Проверка существования курса через Course Service
+    # Проверка существования курса (метаданные из кэша)
     try:
-        response = requests.get(
-            f"{app.config['COURSE_SERVICE_URL']}/courses/{course_id}",
-            headers={'Authorization': f"Bearer {get_auth_header()}"},
-            timeout=2
-        )
-        if response.status_code != 200:
-            return jsonify({'error': 'Курс не найден'}), 404
-        
-        course = response.json()
-        if course['creator_id'] != current_user['id'] and current_user['role'] != 'admin':
-            return jsonify({'error': 'У вас нет прав на редактирование этого курса'}), 403
+        course = get_course_meta(course_id)
     except:
         return jsonify({'error': 'Ошибка связи с сервисом курсов'}), 500
+    if course is None:
+        return jsonify({'error': 'Курс не найден'}), 404
+    if course['creator_id'] != current_user['id'] and current_user['role'] != 'admin':
+        return jsonify({'error': 'У вас нет прав на редактирование этого курса'}), 403
     
     data = request.json
-    existing_lessons = Lesson.query.filter_by(course_id=course_id).count()
+    existing_lessons = course_lesson_count(course_id)
     
-    # Обработка изображений
+    # Обработка изображений: base64 сохраняется в хранилище блобов, в уроке - только ссылки
     images = data.get('images', [])
     if isinstance(images, list):
-        # Если изображения переданы как base64, сохраняем их
-        processed_images = []
-        for img in images:
-            if isinstance(img, dict):
-                # Формат: {"data": "base64...", "type": "image/png", "name": "image.png"}
-                processed_images.append(img)
-            elif isinstance(img, str):
-                # Просто base64 строка
-                processed_images.append({"data": img, "type": "image/png"})
-        images = processed_images
+        try:
+            images = process_images(images)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        images = []
     
     lesson = Lesson(
         course_id=course_id,
@@ -201,6 +642,7 @@ def create_lesson(course_id, current_user=None):
     )
     lesson.set_images(images)
     db.session.add(lesson)
+    change_lesson_count(course_id, 1)
     db.session.commit()
     
     return jsonify({
@@ -215,21 +657,21 @@ def create_lesson(course_id, current_user=None):
 
 @app.route('/lessons/<int:lesson_id>', methods=['GET'])
 @login_required
-def get_lesson(lesson_id):
+def get_lesson(lesson_id, current_user=None):
     """Получить информацию об уроке"""
     lesson = Lesson.query.get_or_404(lesson_id)
     
-    # Проверка доступа к курсу
+    # Проверка доступа к курсу: неопубликованный видят преподаватели и создатель
     try:
-        response = requests.get(
-            f"{app.config['COURSE_SERVICE_URL']}/courses/{lesson.course_id}",
-            headers={'Authorization': f"Bearer {get_auth_header()}"},
-            timeout=2
-        )
-        if response.status_code != 200:
-            return jsonify({'error': 'Курс не найден'}), 404
+        course = get_course_meta(lesson.course_id)
     except:
         return jsonify({'error': 'Ошибка связи с сервисом курсов'}), 500
+    if course is None or not (
+        course['is_published']
+        or current_user['role'] in ['teacher', 'admin']
+        or course['creator_id'] == current_user['id']
+    ):
+        return jsonify({'error': 'Курс не найден'}), 404
     
     return jsonify({
         'id': lesson.id,
@@ -242,6 +684,16 @@ def get_lesson(lesson_id):
     }), 200
 
 
+@app.route('/images/<digest>', methods=['GET'])
+def get_image(digest):
+    """Получить изображение урока (strong ETag, 304, Range, sendfile)"""
+    blob = ImageBlob.query.get(digest) if blob_store.is_digest(digest) else None
+    if not blob or not blob_store.exists(digest):
+        return jsonify({'error': 'Изображение не найдено'}), 404
+    
+    return send_blob(blob_store, digest, blob.content_type)
+
+
 @app.route('/courses/<int:course_id>/enroll', methods=['POST'])
 @login_required
 def enroll_course(course_id, current_user=None):
@@ -250,24 +702,19 @@ def enroll_course(course_id, current_user=None):
     
     # Проверка существования курса
     try:
-        response = requests.get(
-            f"{app.config['COURSE_SERVICE_URL']}/courses/{course_id}",
-            timeout=2
-        )
-        if response.status_code != 200:
-            return jsonify({'error': 'Курс не найден'}), 404
-        
-        course = response.json()
-        if not course.get('is_published'):
-            return jsonify({'error': 'Курс не опубликован'}), 400
+        course = get_course_meta(course_id)
     except:
         return jsonify({'error': 'Ошибка связи с сервисом курсов'}), 500
+    if course is None:
+        return jsonify({'error': 'Курс не найден'}), 404
+    if not course['is_published']:
+        return jsonify({'error': 'Курс не опубликован'}), 400
     
     existing = Enrollment.query.filter_by(user_id=user_id, course_id=course_id).first()
     if existing:
         return jsonify({'error': 'Вы уже записаны на этот курс'}), 400
     
-    enrollment = Enrollment(user_id=user_id, course_id=course_id)
+    enrollment = Enrollment(user_id=user_id, course_id=course_id, total_lessons=course_lesson_count(course_id))
     db.session.add(enrollment)
     db.session.commit()
     
@@ -276,48 +723,68 @@ def enroll_course(course_id, current_user=None):
 
 @app.route('/courses/<int:course_id>/enrollments', methods=['GET'])
 @login_required
-def get_enrollments(course_id):
-    """Получить записи на курс"""
-    enrollments = Enrollment.query.filter_by(course_id=course_id).all()
+def get_enrollments(course_id, current_user=None):
+    """Получить записи на курс (?limit=&after=)"""
+    try:
+        page = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = Enrollment.query.filter_by(course_id=course_id)
+    if page:
+        enrollments, next_after = fetch_page(query, [Enrollment.id], page)
+    else:
+        enrollments = query.all()
     
-    return jsonify([{
+    items = [{
         'id': e.id,
         'user_id': e.user_id,
         'course_id': e.course_id,
         'progress': e.progress,
         'enrolled_at': e.enrolled_at.isoformat()
-    } for e in enrollments]), 200
+    } for e in enrollments]
+    if page:
+        return jsonify({'items': items, 'next_after': next_after}), 200
+    return jsonify(items), 200
 
 
 @app.route('/users/<int:user_id>/enrollments', methods=['GET'])
 @login_required
 def get_user_enrollments(user_id, current_user=None):
-    """Получить курсы пользователя"""
+    """Получить курсы пользователя (?limit=&after=)"""
     if current_user['id'] != user_id and current_user['role'] not in ['admin']:
         return jsonify({'error': 'Доступ запрещен'}), 403
+    try:
+        page = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    enrollments = Enrollment.query.filter_by(user_id=user_id).all()
+    query = Enrollment.query.filter_by(user_id=user_id)
+    if page:
+        enrollments, next_after = fetch_page(query, [Enrollment.id], page)
+    else:
+        enrollments = query.all()
     
-    # Получение информации о курсах
+    # Получение информации о курсах одним пакетным запросом
+    try:
+        courses = fetch_courses([enrollment.course_id for enrollment in enrollments], ['id', 'title', 'description'])
+    except (RuntimeError, requests.RequestException) as e:
+        print(f"Course batch lookup failed: {e}")
+        return jsonify({'error': 'Ошибка связи с сервисом курсов'}), 500
     courses_info = []
     for enrollment in enrollments:
-        try:
-            response = requests.get(
-                f"{app.config['COURSE_SERVICE_URL']}/courses/{enrollment.course_id}",
-                timeout=2
-            )
-            if response.status_code == 200:
-                course = response.json()
-                courses_info.append({
-                    'course_id': course['id'],
-                    'title': course['title'],
-                    'description': course['description'],
-                    'progress': enrollment.progress,
-                    'enrolled_at': enrollment.enrolled_at.isoformat()
-                })
-        except:
-            pass
-    
+        course = courses.get(enrollment.course_id)
+        if course:
+            courses_info.append({
+                'course_id': course['id'],
+                'title': course['title'],
+                'description': course['description'],
+                'progress': enrollment.progress,
+                'enrolled_at': enrollment.enrolled_at.isoformat()
+            })
+    
+    if page:
+        return jsonify({'items': courses_info, 'next_after': next_after}), 200
     return jsonify(courses_info), 200
 
 
@@ -329,19 +796,13 @@ def update_lesson(lesson_id, current_user=None):
     
     # Проверка прав на курс
     try:
-        response = requests.get(
-            f"{app.config['COURSE_SERVICE_URL']}/courses/{lesson.course_id}",
-            headers={'Authorization': f"Bearer {get_auth_header()}"},
-            timeout=2
-        )
-        if response.status_code != 200:
-            return jsonify({'error': 'Курс не найден'}), 404
-        
-        course = response.json()
-        if course['creator_id'] != current_user['id'] and current_user['role'] != 'admin':
-            return jsonify({'error': 'У вас нет прав на редактирование этого урока'}), 403
+        course = get_course_meta(lesson.course_id)
     except:
         return jsonify({'error': 'Ошибка связи с сервисом курсов'}), 500
+    if course is None:
+        return jsonify({'error': 'Курс не найден'}), 404
+    if course['creator_id'] != current_user['id'] and current_user['role'] != 'admin':
+        return jsonify({'error': 'У вас нет прав на редактирование этого урока'}), 403
     
     data = request.json
     if 'title' in data:
@@ -351,13 +812,10 @@ def update_lesson(lesson_id, current_user=None):
     if 'images' in data:
         images = data['images']
         if isinstance(images, list):
-            processed_images = []
-            for img in images:
-                if isinstance(img, dict):
-                    processed_images.append(img)
-                elif isinstance(img, str):
-                    processed_images.append({"data": img, "type": "image/png"})
-            lesson.set_images(processed_images)
+            try:
+                lesson.set_images(process_images(images))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
     if 'order' in data:
         lesson.order = data['order']
     
@@ -381,26 +839,42 @@ def delete_lesson(lesson_id, current_user=None):
     
     # Проверка прав на курс
     try:
-        response = requests.get(
-            f"{app.config['COURSE_SERVICE_URL']}/courses/{lesson.course_id}",
-            headers={'Authorization': f"Bearer {get_auth_header()}"},
-            timeout=2
-        )
-        if response.status_code != 200:
-            return jsonify({'error': 'Курс не найден'}), 404
-        
-        course = response.json()
-        if course['creator_id'] != current_user['id'] and current_user['role'] != 'admin':
-            return jsonify({'error': 'У вас нет прав на удаление этого урока'}), 403
+        course = get_course_meta(lesson.course_id)
     except:
         return jsonify({'error': 'Ошибка связи с сервисом курсов'}), 500
-    
+    if course is None:
+        return jsonify({'error': 'Курс не найден'}), 404
+    if course['creator_id'] != current_user['id'] and current_user['role'] != 'admin':
+        return jsonify({'error': 'У вас нет прав на удаление этого урока'}), 403
+    
+    # Отметки о прохождении удаляемого урока больше не учитываются в прогрессе
+    db.session.execute(
+        text('UPDATE enrollment SET completed_lessons = completed_lessons - 1 WHERE course_id = :course_id '
+             'AND user_id IN (SELECT user_id FROM lesson_progress WHERE lesson_id = :lesson_id)'),
+        {'course_id': lesson.course_id, 'lesson_id': lesson.id}
+    )
+    LessonProgress.query.filter_by(lesson_id=lesson.id).delete(synchronize_session=False)
     db.session.delete(lesson)
+    change_lesson_count(lesson.course_id, -1)
     db.session.commit()
     
     return jsonify({'message': 'Урок успешно удален'}), 200
 
 
+@app.route('/progress/recompute', methods=['POST'])
+@login_required
+def recompute_progress(current_user=None):
+    """Пересчитать счетчики уроков и прогресса из исходных таблиц (все курсы или {"course_id": N})"""
+    if current_user['role'] != 'admin':
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    course_id = (request.get_json(silent=True) or {}).get('course_id')
+    updated = recompute(db.session.connection(), course_id)
+    db.session.commit()
+    
+    return jsonify({'message': 'Счетчики пересчитаны', 'enrollments': updated}), 200
+
+
 @app.route('/lessons/<int:lesson_id>/complete', methods=['POST'])
 @login_required
 def complete_lesson(lesson_id, current_user=None):
@@ -422,23 +896,84 @@ def complete_lesson(lesson_id, current_user=None):
     progress = LessonProgress(user_id=user_id, lesson_id=lesson_id)
     db.session.add(progress)
     
-    # Обновление общего прогресса
-    total_lessons = Lesson.query.filter_by(course_id=lesson.course_id).count()
-    completed_lessons = LessonProgress.query.filter_by(user_id=user_id).join(
-        Lesson, LessonProgress.lesson_id == Lesson.id
-    ).filter(Lesson.course_id == lesson.course_id).count()
-    
-    if total_lessons > 0:
-        enrollment.progress = int((completed_lessons + 1) / total_lessons * 100)
-    
-    db.session.commit()
+    # Обновление общего прогресса по счетчикам записи (O(1), без подсчета уроков);
+    # инкремент в самом UPDATE, чтобы параллельные отметки не терялись
+    db.session.execute(
+        text('UPDATE enrollment SET completed_lessons = completed_lessons + 1 WHERE id = :id'),
+        {'id': enrollment.id}
+    )
+    db.session.execute(text(f'UPDATE enrollment SET progress = {PROGRESS_SQL} WHERE id = :id'), {'id': enrollment.id})
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Тот же урок отмечен параллельным запросом
+        db.session.rollback()
     
+    db.session.refresh(enrollment)
     return jsonify({
         'message': 'Урок отмечен как пройденный',
         'progress': enrollment.progress
     }), 200
 
 
+
+@app.route('/progress/batch', methods=['POST'])
+@login_required
+def complete_lessons_batch(current_user=None):
+    """Отметить пройденными несколько уроков за один запрос ({"lesson_ids": [...]})"""
+    data = request.get_json(silent=True) or {}
+    lesson_ids = data.get('lesson_ids')
+    if not isinstance(lesson_ids, list) or not lesson_ids:
+        return jsonify({'error': 'Требуется непустой список lesson_ids'}), 400
+    if not all(isinstance(lesson_id, int) and not isinstance(lesson_id, bool) for lesson_id in lesson_ids):
+        return jsonify({'error': 'lesson_ids должны быть целыми числами'}), 400
+    lesson_ids = sorted(set(lesson_ids))
+    if len(lesson_ids) > app.config['PROGRESS_BATCH_MAX']:
+        return jsonify({'error': f"Не больше {app.config['PROGRESS_BATCH_MAX']} уроков за запрос"}), 400
+    user_id = current_user['id']
+    
+    # Уроки и записи пользователя на их курсы - по одному запросу на пакет
+    lesson_courses = dict(
+        db.session.query(Lesson.id, Lesson.course_id).filter(Lesson.id.in_(lesson_ids)).all()
+    )
+    enrolled = {
+        course_id for (course_id,) in db.session.query(Enrollment.course_id).filter(
+            Enrollment.user_id == user_id,
+            Enrollment.course_id.in_(sorted(set(lesson_courses.values())))
+        )
+    } if lesson_courses else set()
+    accepted = [lesson_id for lesson_id, course_id in lesson_courses.items() if course_id in enrolled]
+    
+    inserted = 0
+    if accepted:
+        # Один INSERT на весь пакет; уже пройденные уроки отсекает ограничение unique_lesson_progress
+        inserted = db.session.execute(text(
+            'INSERT INTO lesson_progress (user_id, lesson_id, completed_at) '
+            'SELECT :user_id, id, :completed_at FROM lesson WHERE id IN :lesson_ids '
+            'ON CONFLICT (user_id, lesson_id) DO NOTHING'
+        ).bindparams(bindparam('lesson_ids', expanding=True), bindparam('completed_at', type_=db.DateTime)), {
+            'user_id': user_id, 'completed_at': datetime.utcnow(), 'lesson_ids': accepted
+        }).rowcount
+        # Каждая затронутая запись на курс пересчитывается один раз на пакет
+        recount_user(db.session.connection(), user_id, {lesson_courses[lesson_id] for lesson_id in accepted})
+        db.session.commit()
+    
+    enrollments = Enrollment.query.options(
+        load_only(Enrollment.course_id, Enrollment.progress)
+    ).filter(
+        Enrollment.user_id == user_id, Enrollment.course_id.in_(sorted(enrolled))
+    ).all() if enrolled else []
+    
+    return jsonify({
+        'message': 'Уроки отмечены как пройденные',
+        'completed': inserted,
+        'already_completed': len(accepted) - inserted,
+        'not_found': [lesson_id for lesson_id in lesson_ids if lesson_id not in lesson_courses],
+        'not_enrolled': [lesson_id for lesson_id, course_id in lesson_courses.items() if course_id not in enrolled],
+        'progress': {str(enrollment.course_id): enrollment.progress for enrollment in enrollments}
+    }), 200
+
+
 if __name__ == '__main__':
     init_db()
     port = int(os.environ.get('PORT', 5003))
@@ -0,0 +1,137 @@
+"""
+Контентно-адресуемое хранилище изображений на локальном диске
+
+Каждое изображение хранится один раз в виде сырых байт (не base64) в файле,
+имя которого - SHA-256 содержимого: root/ab/cd/abcd.... Повторная загрузка
+того же изображения не создает новый файл.
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from flask import send_file
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Содержимое по адресу-хешу никогда не меняется: кэшировать можно "навсегда"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Допустимые типы изображений: только растровые форматы. HTML и SVG, отданные
+# с домена платформы, выполнили бы скрипты автора урока у других пользователей
+IMAGE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp')
+TYPE_ALIASES = {'image/jpg': 'image/jpeg', 'image/pjpeg': 'image/jpeg'}
+
+
+def sniff_image_type(data):
+    """Тип изображения по сигнатуре в начале файла или None"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if data.startswith(b'RIFF') and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def decode_image(value, default_type='image/png'):
+    """Разобрать 'data:image/png;base64,...' или голую base64 строку в (тип, байты)
+
+    Заявленный тип должен быть из IMAGE_TYPES, а байты - начинаться с
+    сигнатуры одного из этих форматов; сохраняется тип по сигнатуре.
+    """
+    if not isinstance(value, str):
+        raise ValueError('Данные изображения должны быть строкой base64')
+    if not isinstance(default_type, str):
+        raise ValueError('Тип изображения должен быть строкой')
+    content_type = default_type
+    if value.startswith('data:') and ',' in value:
+        header, value = value.split(',', 1)
+        content_type = header[5:].split(';')[0] or default_type
+    content_type = content_type.strip().lower()
+    content_type = TYPE_ALIASES.get(content_type, content_type)
+    if content_type not in IMAGE_TYPES:
+        raise ValueError(f'Неподдерживаемый тип изображения: {content_type} (допустимы PNG, JPEG, GIF, WebP)')
+    try:
+        data = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError('Некорректные данные изображения (ожидается base64)')
+    actual_type = sniff_image_type(data)
+    if actual_type is None:
+        raise ValueError('Данные не являются изображением PNG, JPEG, GIF или WebP')
+    return actual_type, data
+
+
+def send_blob(store, digest, content_type):
+    """Ответ с содержимым блоба: strong ETag, 304, Range и immutable Cache-Control
+
+    Файл передается по пути, поэтому WSGI сервер с wsgi.file_wrapper
+    (gunicorn) отдает его через sendfile, не читая байты в Python.
+    При USE_X_SENDFILE отдачу файла берет на себя фронтовой веб-сервер.
+    Блобы, сохраненные до проверки типа, с другим типом отдаются как
+    application/octet-stream; nosniff и sandbox не дают браузеру исполнить
+    содержимое на домене платформы.
+    """
+    if content_type not in IMAGE_TYPES:
+        content_type = 'application/octet-stream'
+    response = send_file(
+        store.path(digest),
+        mimetype=content_type,
+        conditional=True,
+        etag=digest,
+        max_age=IMMUTABLE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = 'sandbox'
+    return response
+
+
+class BlobStore:
+    """Хранилище блобов, адресуемых SHA-256"""
+
+    def __init__(self, root):
+        self.root = root
+
+    @staticmethod
+    def is_digest(value):
+        """Строка похожа на SHA-256 в hex (защита от обхода путей)"""
+        return isinstance(value, str) and bool(DIGEST_RE.match(value))
+
+    def path(self, digest):
+        """Путь к файлу блоба"""
+        if not self.is_digest(digest):
+            raise ValueError(f'Invalid blob digest: {digest!r}')
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        """Есть ли блоб в хранилище"""
+        return self.is_digest(digest) and os.path.exists(self.path(digest))
+
+    def put(self, data):
+        """Сохранить байты и вернуть их SHA-256 (идемпотентно)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Запись во временный файл и атомарное переименование: читатели
+        # никогда не увидят недописанный блоб
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest
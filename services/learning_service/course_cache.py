@@ -0,0 +1,169 @@
+"""
+Кэш метаданных курсов (создатель, флаг публикации, существование) для Learning Service
+
+Проверки прав и публикации в уроках и записях на курс читают метаданные
+отсюда, а не запросом GET /courses/<id> к Course Service на каждый вызов.
+Запись живет не дольше TTL. Кэш свой у каждого воркера gunicorn каждой
+реплики, поэтому изменения курсов приходят двумя путями: уведомление
+POST /course-cache/invalidate от Course Service сразу сбрасывает запись, но
+доходит только до одного воркера (best effort), а CourseChangeFeed в каждом
+воркере опрашивает журнал GET /course-changes и сбрасывает измененные курсы
+не позже чем через интервал опроса. Отсутствующий курс кэшируется (как None)
+на короткое время.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from token_cache import MISS
+
+
+class CourseMetaCache:
+    """Потокобезопасный LRU кэш метаданных курсов с TTL"""
+
+    def __init__(self, fetch, max_size=10000, ttl=30, negative_ttl=5):
+        # fetch(course_id) -> {'creator_id', 'is_published'}, None для
+        # несуществующего курса; при сбое связи бросает исключение (не кэшируется)
+        self.fetch = fetch
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_discarded = 0
+        # Увеличивается при каждом сбросе: загрузка, начатая до сброса, не
+        # сохраняет в кэш метаданные, прочитанные до изменения курса
+        self._generation = 0
+
+    def _lookup(self, course_id):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(course_id)
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(course_id)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, course_id):
+        """Метаданные курса или None, если курса нет"""
+        meta = self._lookup(course_id)
+        if meta is not MISS:
+            return meta
+
+        with self._lock:
+            generation = self._generation
+        meta = self.fetch(course_id)
+        ttl = self.ttl if meta is not None else self.negative_ttl
+        if self.max_size > 0 and ttl > 0:
+            with self._lock:
+                if generation != self._generation:
+                    self.stale_discarded += 1
+                    return meta
+                self._entries[course_id] = (meta, time.time() + ttl)
+                self._entries.move_to_end(course_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return meta
+
+    def invalidate(self, course_id):
+        """Удалить запись курса (уведомление об изменении от Course Service)"""
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(course_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Счетчики для диагностики"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'negative_ttl': self.negative_ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale_discarded': self.stale_discarded,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+class CourseChangeFeed:
+    """Журнал изменений курсов Course Service, синхронизируемый в фоне с кэшем воркера"""
+
+    def __init__(self, cache, fetch_changes, poll_interval=2):
+        self.cache = cache
+        # fetch_changes(since) -> {'course_ids', 'last_id', 'reset', 'more'} из
+        # GET /course-changes (since=None - только текущая позиция журнала)
+        self.fetch_changes = fetch_changes
+        self.poll_interval = poll_interval
+        self._last_id = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.failures = 0
+        self.resets = 0
+
+    def start(self):
+        """Запустить фоновый опрос (лениво, при первом обращении к кэшу в воркере)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.poll()
+            time.sleep(self.poll_interval)
+
+    def poll(self):
+        """Сбросить в кэше курсы, измененные после прошлого опроса"""
+        while True:
+            try:
+                data = self.fetch_changes(self._last_id)
+            except Exception as e:
+                self.failures += 1
+                print(f"Course changes poll failed: {e}")
+                return False
+
+            if self._last_id is None or data.get('reset'):
+                # Первый опрос или пропущенные изменения: записи, загруженные
+                # до этого момента, могли устареть
+                if self._last_id is not None:
+                    self.resets += 1
+                self._last_id = data['last_id']
+                self.cache.clear()
+                return True
+
+            for course_id in data['course_ids']:
+                self.cache.invalidate(course_id)
+            self._last_id = data['last_id']
+            # Course Service отдает журнал страницами, догоняем до конца
+            if not data.get('more'):
+                return True
+
+    def stats(self):
+        """Состояние синхронизации для диагностики"""
+        return {
+            'last_id': self._last_id,
+            'poll_interval': self.poll_interval,
+            'failures': self.failures,
+            'resets': self.resets
+        }
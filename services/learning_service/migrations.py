@@ -0,0 +1,94 @@
+"""
+Версионные миграции схемы БД Learning Service
+
+db.create_all() создает только отсутствующие таблицы и не меняет уже
+существующие, поэтому новые индексы и колонки добавляются миграциями.
+Примененные версии записываются в таблицу schema_version; при старте
+сервиса выполняются только еще не примененные. SQL совместим с SQLite
+и PostgreSQL.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from progress_counters import recompute
+from search_index import SearchIndex
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+# Полнотекстовый индекс уроков (FTS5, обновляется триггерами на таблице lesson).
+# Объявлен здесь, потому что в существующую БД его добавляет миграция;
+# app.py использует этот же объект для поиска
+LESSON_SEARCH = SearchIndex('lesson', ['title', 'content'], weights=(10.0, 1.0))
+
+# (версия, описание, список SQL выражений или функций fn(connection))
+MIGRATIONS = [
+    (1, 'Indexes for hot lookup columns', [
+        'CREATE INDEX IF NOT EXISTS ix_lesson_course_order ON lesson (course_id, "order")',
+        'CREATE INDEX IF NOT EXISTS ix_enrollment_course_id ON enrollment (course_id)',
+        'CREATE INDEX IF NOT EXISTS ix_lesson_progress_lesson_id ON lesson_progress (lesson_id)',
+    ]),
+    # Таблицу course_stats создает db.create_all() до запуска миграций
+    (2, 'Denormalized lesson and progress counters', [
+        'ALTER TABLE enrollment ADD COLUMN total_lessons INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE enrollment ADD COLUMN completed_lessons INTEGER NOT NULL DEFAULT 0',
+        recompute,
+    ]),
+    # В новой БД индекс создается вместе с таблицей lesson (SearchIndex.attach)
+    (3, 'Full-text search index on lesson', [
+        LESSON_SEARCH.migrate,
+    ]),
+]
+
+
+def applied_versions(connection):
+    """Версии, уже примененные к БД"""
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+    return {row[0] for row in connection.execute(text(f'SELECT version FROM {SCHEMA_VERSION_TABLE}'))}
+
+
+def record_version(connection, version, description):
+    connection.execute(
+        text(f'INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (:version, :description, :applied_at)'),
+        {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+    )
+
+
+def run_migrations(engine, migrations=MIGRATIONS):
+    """Применить недостающие миграции по порядку, каждую в своей транзакции"""
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+
+    done = []
+    for version, description, steps in sorted(migrations, key=lambda migration: migration[0]):
+        if version in applied:
+            continue
+        with engine.begin() as connection:
+            for step in steps:
+                if callable(step):
+                    step(connection)
+                else:
+                    connection.execute(text(step))
+            record_version(connection, version, description)
+        print(f"Applied migration {version}: {description}")
+        done.append(version)
+    return done
+
+
+def init_schema(db, migrations=MIGRATIONS):
+    """Создать схему новой БД или обновить существующую до последней версии"""
+    fresh = not inspect(db.engine).get_table_names()
+    db.create_all()
+    if not fresh:
+        return run_migrations(db.engine, migrations)
+
+    # Новая БД создана по текущим моделям (с индексами): миграции только отмечаются
+    with db.engine.begin() as connection:
+        applied_versions(connection)
+        for version, description, _ in migrations:
+            record_version(connection, version, description)
+    return []
@@ -0,0 +1,46 @@
+"""
+Keyset (cursor) пагинация списков: ?limit=N&after=<курсор>
+
+Страница выбирается условием "строго после последней строки предыдущей
+страницы" по индексируемым колонкам сортировки, а не через OFFSET, поэтому
+стоимость запроса не растет с номером страницы. Курсор - значения колонок
+сортировки последней строки через двоеточие (последняя колонка - id).
+"""
+
+from sqlalchemy import and_, or_
+
+
+def parse_page(args, default_limit, max_limit, cursor_size=1):
+    """(limit, after) из параметров запроса; None - запрос без пагинации (полный список, как раньше)"""
+    if 'limit' not in args and 'after' not in args:
+        return None
+    try:
+        limit = int(args.get('limit', default_limit))
+        after = [int(part) for part in args['after'].split(':')] if args.get('after') else None
+    except ValueError:
+        raise ValueError('Параметры limit и after должны быть числами')
+    if limit < 1:
+        raise ValueError('Параметр limit должен быть больше 0')
+    if after is not None and len(after) != cursor_size:
+        raise ValueError('Некорректный курсор after')
+    return min(limit, max_limit), after
+
+
+def after_cursor(columns, after):
+    """Условие (c1, c2, ...) > (v1, v2, ...) для сортировки по columns"""
+    condition = columns[-1] > after[-1]
+    for column, value in zip(reversed(columns[:-1]), reversed(after[:-1])):
+        condition = or_(column > value, and_(column == value, condition))
+    return condition
+
+
+def fetch_page(query, columns, page):
+    """Строки страницы и курсор следующей (None на последней странице)"""
+    limit, after = page
+    if after is not None:
+        query = query.filter(after_cursor(columns, after))
+    rows = query.order_by(*columns).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, ':'.join(str(getattr(rows[-1], column.key)) for column in columns)
@@ -0,0 +1,54 @@
+"""
+Денормализованные счетчики прогресса: пересчет из исходных таблиц
+
+В рабочем режиме счетчики (course_stats.lesson_count, enrollment.total_lessons,
+enrollment.completed_lessons, enrollment.progress) обновляются инкрементально
+в тех же транзакциях, что и уроки/отметки о прохождении. Здесь - полный
+пересчет набором UPDATE (для миграции и для ремонта после ручных правок БД)
+и пересчет записей одного пользователя после пакетной отметки уроков.
+"""
+
+from sqlalchemy import bindparam, text
+
+# Процент прохождения в целых числах (одинаково в SQLite и PostgreSQL)
+PROGRESS_SQL = 'CASE WHEN total_lessons > 0 THEN completed_lessons * 100 / total_lessons ELSE 0 END'
+
+
+def recompute(connection, course_id=None):
+    """Пересчитать счетчики всех курсов или одного курса; вернуть число обновленных записей на курсы"""
+    where = ' WHERE course_id = :course_id' if course_id is not None else ''
+    params = {'course_id': course_id} if course_id is not None else {}
+
+    connection.execute(text(f'DELETE FROM course_stats{where}'), params)
+    connection.execute(text(
+        f'INSERT INTO course_stats (course_id, lesson_count) SELECT course_id, count(*) FROM lesson{where} GROUP BY course_id'
+    ), params)
+    result = connection.execute(text(
+        'UPDATE enrollment SET '
+        'total_lessons = COALESCE((SELECT lesson_count FROM course_stats '
+        'WHERE course_stats.course_id = enrollment.course_id), 0), '
+        'completed_lessons = (SELECT count(*) FROM lesson_progress JOIN lesson ON lesson.id = lesson_progress.lesson_id '
+        'WHERE lesson_progress.user_id = enrollment.user_id AND lesson.course_id = enrollment.course_id)'
+        f'{where}'
+    ), params)
+    connection.execute(text(f'UPDATE enrollment SET progress = {PROGRESS_SQL}{where}'), params)
+    return result.rowcount
+
+
+def recount_user(connection, user_id, course_ids):
+    """Пересчитать completed_lessons и progress записей пользователя на курсы course_ids (по одному UPDATE на пакет)"""
+    if not course_ids:
+        return 0
+    params = {'user_id': user_id, 'course_ids': list(course_ids)}
+    where = ' WHERE user_id = :user_id AND course_id IN :course_ids'
+    result = connection.execute(text(
+        'UPDATE enrollment SET '
+        'completed_lessons = (SELECT count(*) FROM lesson_progress JOIN lesson ON lesson.id = lesson_progress.lesson_id '
+        'WHERE lesson_progress.user_id = enrollment.user_id AND lesson.course_id = enrollment.course_id)'
+        f'{where}'
+    ).bindparams(bindparam('course_ids', expanding=True)), params)
+    connection.execute(
+        text(f'UPDATE enrollment SET progress = {PROGRESS_SQL}{where}').bindparams(bindparam('course_ids', expanding=True)),
+        params
+    )
+    return result.rowcount
@@ -0,0 +1,175 @@
+"""
+Полнотекстовый поиск на SQLite FTS5 (Course Service, Learning Service)
+
+Индекс - виртуальная таблица <table>_fts с внешним содержимым: тексты не
+дублируются, индекс хранит только токены. Триггеры AFTER INSERT/UPDATE/DELETE
+на исходной таблице обновляют индекс в той же транзакции, что и изменение
+строки, поэтому индекс всегда согласован с данными (в том числе при
+изменениях в обход API) и общий для всех воркеров gunicorn.
+
+Виртуальную таблицу в моделях не описать, поэтому в новой БД индекс
+создается вместе с исходной таблицей (событие after_create в db.create_all()),
+а в существующую добавляется версионной миграцией (migrations.py), которая
+заполняет его из таблицы ('rebuild'). Без FTS5 (не SQLite или SQLite без
+модуля fts5) индекс не создается, а поиск сообщает, что недоступен.
+"""
+
+import re
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from pagination import parse_page
+
+# Слова запроса (буквы любого алфавита, цифры) и признак префикса
+TERM_RE = re.compile(r'\w+\*?')
+MAX_TERMS = 16
+
+
+def match_expression(query):
+    """Запрос пользователя -> выражение FTS5 MATCH или None
+
+    Все слова обязательны. Слово со * на конце и последнее слово ищутся по
+    префиксу (поиск по мере ввода): "pyth" находит "Python". Операторы FTS5
+    из запроса не передаются.
+    """
+    terms = TERM_RE.findall(query or '')[:MAX_TERMS]
+    parts = []
+    for index, term in enumerate(terms):
+        word = term.rstrip('*')
+        prefix = term.endswith('*') or index == len(terms) - 1
+        parts.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(parts) or None
+
+
+def parse_search(args, default_limit, max_limit):
+    """(выражение MATCH, limit, offset) из ?q=&limit=&after=
+
+    Курсор after - число уже отданных результатов: ранжирование все равно
+    оценивает все совпадения, поэтому keyset по рангу ничего бы не сэкономил.
+    """
+    expression = match_expression(args.get('q'))
+    if expression is None:
+        raise ValueError('Параметр q должен содержать хотя бы одно слово')
+    limit, after = parse_page(args, default_limit, max_limit) or (default_limit, None)
+    if after and after[0] < 0:
+        raise ValueError('Параметр after не может быть отрицательным')
+    return expression, limit, after[0] if after else 0
+
+
+class SearchIndex:
+    """FTS5 индекс текстовых колонок таблицы (rowid индекса = id строки)"""
+
+    def __init__(self, table, columns, weights):
+        self.table = table
+        self.columns = columns
+        # Веса колонок в bm25: совпадение в заголовке важнее, чем в тексте
+        self.weights = weights
+        self.fts = f'{table}_fts'
+        self._available = False
+
+    def create_statements(self):
+        columns = ', '.join(self.columns)
+        new_values = ', '.join(f'new.{column}' for column in self.columns)
+        old_values = ', '.join(f'old.{column}' for column in self.columns)
+        delete_old = (
+            f"INSERT INTO {self.fts}({self.fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+        )
+        insert_new = f'INSERT INTO {self.fts}(rowid, {columns}) VALUES (new.id, {new_values});'
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts} USING fts5({columns}, content='{self.table}', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts}_ai AFTER INSERT ON {self.table} BEGIN {insert_new} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts}_ad AFTER DELETE ON {self.table} BEGIN {delete_old} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts}_au AFTER UPDATE OF {columns} ON {self.table} '
+            f'BEGIN {delete_old} {insert_new} END',
+        ]
+
+    def _exists(self, connection):
+        return connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': self.fts}
+        ).first() is not None
+
+    def create(self, connection, rebuild=False):
+        """Создать индекс и триггеры, если их нет; False - поиск недоступен"""
+        if connection.dialect.name != 'sqlite':
+            print(f"Full-text search needs SQLite FTS5, {self.fts} is not created")
+            return False
+        try:
+            for statement in self.create_statements():
+                connection.execute(text(statement))
+            if rebuild:
+                connection.execute(text(f"INSERT INTO {self.fts}({self.fts}) VALUES ('rebuild')"))
+        except OperationalError as e:
+            # SQLite собран без FTS5
+            print(f"Full-text search is unavailable: {e}")
+            return False
+        return True
+
+    def attach(self, table):
+        """Создавать индекс вместе с таблицей модели (новая БД)"""
+        event.listen(table, 'after_create', lambda target, connection, **kw: self.create(connection))
+
+    def migrate(self, connection):
+        """Шаг миграции существующей БД: создать индекс и заполнить его из таблицы"""
+        if self.create(connection, rebuild=True):
+            print(f"Built full-text index {self.fts}")
+
+    def available(self, session):
+        """Есть ли индекс в БД (init_db мог выполняться в другом процессе)"""
+        if not self._available:
+            self._available = session.get_bind().dialect.name == 'sqlite' and self._exists(session)
+        return self._available
+
+    def rank(self):
+        """Выражение ранга bm25 (меньше - релевантнее)"""
+        return f"bm25({self.fts}, {', '.join(str(weight) for weight in self.weights)})"
+
+    def snippet(self, column, tokens=16):
+        """Фрагмент текста колонки вокруг найденных слов"""
+        return f"snippet({self.fts}, {self.columns.index(column)}, '', '', '…', {tokens})"
+
+    def search(self, session, expression, limit, offset, snippet_column, where=None, params=None,
+               columns=(), accept=None, max_scan=1000):
+        """Страница [(id, ...columns, фрагмент)] по убыванию релевантности и курсор следующей (None на последней)
+
+        where - дополнительное условие по строкам исходной таблицы (псевдоним t).
+        accept(row) - проверка строки, которую не выразить в SQL (доступ к курсу
+        другого сервиса): строки читаются из одного ранжированного результата,
+        пока не наберется страница, курсор - позиция в этом результате. За
+        запрос проверяется не больше max_scan строк: если страница не набралась,
+        возвращается неполная (возможно, пустая) страница с курсором на позиции,
+        где проверка остановилась.
+        """
+        sql = (
+            f"SELECT t.id{''.join(f', t.{column}' for column in columns)}, "
+            f"{self.snippet(snippet_column)} AS snippet FROM {self.fts} "
+            f"JOIN {self.table} AS t ON t.id = {self.fts}.rowid "
+            f"WHERE {self.fts} MATCH :expression{' AND ' + where if where else ''} "
+            f"ORDER BY {self.rank()}, t.id LIMIT :limit OFFSET :offset"
+        )
+        if accept is None:
+            rows = session.execute(
+                text(sql), dict(params or {}, expression=expression, limit=limit + 1, offset=offset)
+            ).all()
+            if len(rows) <= limit:
+                return rows, None
+            return rows[:limit], str(offset + limit)
+
+        # Строки ранжируются один раз и читаются по мере проверки, не больше max_scan
+        result = session.execute(text(sql), dict(params or {}, expression=expression, limit=max_scan, offset=offset))
+        rows = []
+        position = offset
+        try:
+            for row in result:
+                position += 1
+                if not accept(row):
+                    continue
+                if len(rows) == limit:
+                    return rows, str(position - 1)
+                rows.append(row)
+        finally:
+            result.close()
+        if position - offset == max_scan:
+            return rows, str(position)
+        return rows, None
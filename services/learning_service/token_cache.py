@@ -0,0 +1,108 @@
+"""
+Кэш результатов удаленной валидации токенов (TTL + LRU)
+
+Ключ - SHA-256 от токена, сам токен в памяти не хранится. Положительный
+результат живет не дольше TTL и не дольше exp токена, отрицательный -
+короткое время, чтобы поток неверных токенов не нагружал Auth Service.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+# Маркер промаха: None - валидное закэшированное значение (неверный токен)
+MISS = object()
+
+
+class TokenCache:
+    """Потокобезопасный ограниченный кэш проверенных токенов"""
+
+    def __init__(self, max_size=10000, ttl=60, negative_ttl=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        """Вернуть пользователя, None для закэшированного отказа или MISS"""
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            user, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(key)
+            if user is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return user
+
+    def put(self, token, user):
+        """Закэшировать успешную валидацию с учетом exp токена"""
+        expires_at = time.time() + self.ttl
+        try:
+            exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+        except jwt.InvalidTokenError:
+            exp = None
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        self._store(token, user, expires_at)
+
+    def put_negative(self, token):
+        """Закэшировать отказ Auth Service на короткое время"""
+        if self.negative_ttl > 0:
+            self._store(token, None, time.time() + self.negative_ttl)
+
+    def _store(self, token, user, expires_at):
+        if self.max_size <= 0 or expires_at <= time.time():
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (user, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Очистить кэш"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Счетчики для подбора размера кэша"""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'negative_ttl': self.negative_ttl,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0
+            }